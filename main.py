@@ -11,9 +11,11 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.conf.config import settings
 from src.database.db import get_db
 from src.routes import auth, users, admin
 from src.routes.auth import blacklisted_tokens
+from src.services.cv_service.executor import recognition_executor
 from src.utils.utils import periodic_clean_blacklist
 
 
@@ -21,11 +23,16 @@ from src.utils.utils import periodic_clean_blacklist
 async def lifespan(app: FastAPI):
     # This runs on startup
     task = asyncio.create_task(periodic_clean_blacklist(60))
+    if settings.cv_warm_up:
+        # Spawn recognition workers and load their models before serving requests,
+        # otherwise they are started by the first recognition job
+        await recognition_executor.start()
     
     yield
     
     # This runs on shutdown
     task.cancel()
+    await recognition_executor.shutdown()
 
 
 app = FastAPI(swagger_ui_parameters={"operationsSorter": "method"}, lifespan=lifespan, title="Parking Application")
@@ -23,6 +23,66 @@ class Settings(BaseSettings):
     redis_password: str
     redis_name: str = ''
 
+    ocr_pool_size: int = 1
+    ocr_gpu: bool = False
+    ocr_borrow_timeout: float = 60.0
+    ocr_warm_up: bool = True
+    ocr_mode: str = 'readtext'
+    ocr_flag_margin: float = 0.1
+    ocr_backend: str = 'easyocr'
+    ocr_crnn_model: str = 'plate_crnn.onnx'
+    ocr_crnn_alphabet: str = '0123456789ABCEHIKMOPTX'
+    ocr_crnn_height: int = 32
+    ocr_crnn_width: int = 128
+    preprocess_mode: str = 'adaptive'
+    preprocess_noise_low: float = 2.0
+    preprocess_noise_high: float = 6.0
+    preprocess_contrast_min: float = 40.0
+    preprocess_sharpness_min: float = 100.0
+
+    cv_warm_up: bool = True
+    cv_results_sink: str = ''
+    recognition_executor: str = 'process'
+    recognition_workers: int = 2
+    recognition_queue_size: int = 8
+    recognition_threads_per_worker: int = 0
+
+    detector_backend: str = 'ultralytics'
+    detector_mode: str = 'full'
+    gate_lane_roi: list[float] = [0.0, 0.0, 1.0, 1.0]
+    detector_imgsz: int = 640
+    onnx_cache_dir: str = '.onnx_cache'
+    onnx_threads: int = 0
+
+    track_max_age: int = 30
+    track_min_hits: int = 3
+    track_consensus_threshold: float = 0.8
+    track_consensus_min_reads: int = 3
+
+    video_target_fps: float = 5.0
+    video_idle_fps: float = 1.0
+    video_prefetch_frames: int = 8
+    detection_max_side: int = 1280
+    detection_scale: float = 1.0
+    camera_detection_scales: dict[str, float] = {}
+    video_segment_workers: int = 0
+    video_segment_overlap: int = 150
+    frame_ring_slots: int = 16
+    frame_ring_max_size: list[int] = [1920, 1080]
+    cameras: dict[str, str] = {}
+    camera_reconnect_delay: float = 1.0
+    camera_reconnect_max_delay: float = 30.0
+    ingest_dedup_seconds: float = 30.0
+    ingest_lock_file: str = 'ingest.lock'
+    motion_roi: list[float] = [0.0, 0.0, 1.0, 1.0]
+    motion_threshold: float = 0.01
+    motion_hold_seconds: float = 2.0
+    motion_method: str = 'diff'
+
+    detector_batching: bool = False
+    detector_batch_size: int = 8
+    detector_batch_wait_ms: float = 5.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -15,6 +15,13 @@ from src.services.role import RolesAccess
 from src.services.auth import auth_service
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.services.cv_service.batcher import detection_batcher
+from src.services.cv_service.executor import recognition_executor
+from src.services.cv_service.lic_rec import detection_stats
+from src.services.cv_service.ocr_backends import ocr_backend
+from src.services.cv_service.ocr_pool import reader_pool
+from src.services.cv_service.preprocess import preprocess_stats
+from src.services.cv_service.service import cv_service
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -235,3 +242,19 @@ async def list_blacklisted_vehicles(db: AsyncSession = Depends(get_db), _: User
         raise HTTPException(status_code=404, detail="No blacklisted vehicles found.")
     
     return blacklisted_vehicles
+
+
+@router.get("/cv_metrics", dependencies=[Depends(access_admin)])
+async def get_cv_metrics(_: User = Depends(auth_service.get_current_user)):
+    metrics = {"recognition": recognition_executor.metrics()}
+    if recognition_executor.mode == 'thread':
+        # Only thread mode recognizes in the API process, worker processes keep their own counters
+        metrics.update({
+            "models": cv_service.metrics(),
+            "ocr_pool": reader_pool.metrics(),
+            "ocr": ocr_backend.metrics(),
+            "detector_batcher": detection_batcher.metrics(),
+            "preprocess": preprocess_stats.metrics(),
+            "detection": detection_stats.metrics(),
+        })
+    return metrics
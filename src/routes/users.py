@@ -1,6 +1,5 @@
+from concurrent.futures.process import BrokenProcessPool
 from datetime import timedelta
-import os
-import tempfile
 import uuid
 
 from typing import List
@@ -19,6 +18,7 @@ from src.schemas.users import UserDbSchema, RequestEmail, ParkingEntryResponseSc
 from src.services.auth import auth_service
 from src.services.email import send_email_reset_password
 from src.services.cv_service import initiate, util
+from src.services.cv_service.executor import recognition_executor, QueueFullError
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -116,21 +116,22 @@ async def upload_license_plate(
     file: UploadFile = File(...), db: AsyncSession = Depends(get_db),
 ):
     try:
-        # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            tmp_file.write(await file.read())
-            tmp_file_path = tmp_file.name
+        # Keep the upload in memory, it is decoded straight from the bytes
+        image_bytes = await file.read()
 
         # Pass the image to your ML model to get the license plate text
         try:
-            license_plate_dict = initiate.main(tmp_file_path)
+            license_plate_dict = await recognition_executor.run(initiate.main_from_bytes, image_bytes)
             #license_plate_text = license_plate_dict[0][list(license_plate_dict[0].keys())[0]]['license_plate']['text']
+        except QueueFullError:
+            return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                content={"detail": "Recognition queue is full, please try again later."})
+        except BrokenProcessPool:
+            return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                content={"detail": "Recognition worker restarted, please try again later."})
         except Exception as e:
             response = {'detail':"Could not read the number"}
             return JSONResponse(content=response)
-        finally:
-            # Optionally, store the result in the database if needed
-            os.remove(tmp_file_path)
 
         sanitized_text = util.sanitize_license_plate(license_plate_dict)
 
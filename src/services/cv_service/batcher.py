@@ -0,0 +1,128 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from src.conf.config import settings
+
+
+class DetectionBatcher:
+    """
+    Dynamic micro-batcher for the YOLO detectors.
+
+    Frames submitted concurrently (by parallel requests or cameras) are held for at most
+    `max_wait_ms` until `max_batch_size` of them are collected, then run through
+    `detect_fn` as one batch. Every caller gets a Future resolved with its own output.
+    """
+
+    def __init__(self, detect_fn, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        if max_batch_size < 1:
+            raise ValueError("Detection batch size must be at least 1.")
+        self._detect_fn = detect_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._histogram = collections.Counter()
+        self._frames = 0
+        self._queue_time = 0.0
+        self._inference_time = 0.0
+
+    def submit(self, frame) -> Future:
+        future = Future()
+        self._ensure_started()
+        self._queue.put((frame, future, time.perf_counter()))
+        return future
+
+    def detect(self, frame):
+        """
+        Blocking helper: submit one frame and wait for its detections.
+        """
+        return self.submit(frame).result()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='detection-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            started = time.perf_counter()
+            try:
+                outputs = self._detect_fn([frame for frame, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+            finished = time.perf_counter()
+
+            with self._lock:
+                self._histogram[len(batch)] += 1
+                self._frames += len(batch)
+                self._queue_time += sum(started - submitted for _, _, submitted in batch)
+                self._inference_time += finished - started
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            batches = sum(self._histogram.values())
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': batches,
+                'frames': self._frames,
+                'batch_size_histogram': dict(sorted(self._histogram.items())),
+                'avg_batch_size': round(self._frames / batches, 3) if batches else 0.0,
+                'avg_queue_ms': round(self._queue_time / self._frames * 1000, 3) if self._frames else 0.0,
+                'avg_batch_inference_ms': round(self._inference_time / batches * 1000, 3) if batches else 0.0,
+            }
+
+
+def _detect_frames(frames):
+    # Imported here so that reading metrics never loads the detectors
+    from src.services.cv_service.lic_rec import detect_frames
+
+    return detect_frames(frames)
+
+
+detection_batcher = DetectionBatcher(
+    _detect_frames,
+    max_batch_size=settings.detector_batch_size,
+    max_wait_ms=settings.detector_batch_wait_ms,
+)
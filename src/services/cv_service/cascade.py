@@ -0,0 +1,67 @@
+import numpy as np
+
+from src.services.cv_service.detectors import non_max_suppression
+from src.services.cv_service.service import cv_service
+
+
+# Class ID given to the plates of the gate mode, which stand for their own vehicle (COCO car)
+GATE_VEHICLE_CLASS = 2
+
+# IoU above which plates found in the crops of two overlapping vehicles are the same plate
+DUPLICATE_PLATE_IOU = 0.5
+
+
+def clip_box(box, width, height, padding=0.):
+    x1, y1, x2, y2 = box[:4]
+    pad_x, pad_y = (x2 - x1) * padding, (y2 - y1) * padding
+    return (int(max(0, x1 - pad_x)), int(max(0, y1 - pad_y)),
+            int(min(width, x2 + pad_x)), int(min(height, y2 + pad_y)))
+
+
+def offset_boxes(boxes, x, y):
+    return [[x1 + x, y1 + y, x2 + x, y2 + y, *rest] for x1, y1, x2, y2, *rest in boxes]
+
+
+def detect_cascade(frame, vehicles, padding=0.05):
+    """
+    Run the vehicle detector on the frame, then the plate detector on one batch of
+    vehicle crops only. Returns the (vehicle detections, license plates) of the frame,
+    with the plates in frame coordinates.
+    """
+    height, width = frame.shape[:2]
+    detections = cv_service.coco_model([frame])[0]
+
+    crops, origins = [], []
+    for detection in detections:
+        if int(detection[5]) not in vehicles:
+            continue
+        x1, y1, x2, y2 = clip_box(detection, width, height, padding)
+        if x2 > x1 and y2 > y1:
+            crops.append(frame[y1:y2, x1:x2])
+            origins.append((x1, y1))
+
+    license_plates = []
+    if crops:
+        for (x, y), plates in zip(origins, cv_service.license_plate_detector(crops)):
+            license_plates.extend(offset_boxes(plates, x, y))
+
+    if len(license_plates) > 1:
+        # Overlapping vehicle crops find the same plate more than once
+        boxes = np.asarray(license_plates, dtype=float)
+        keep = non_max_suppression(boxes[:, :4], boxes[:, 4], DUPLICATE_PLATE_IOU)
+        license_plates = [license_plates[i] for i in sorted(keep)]
+    return detections, license_plates
+
+
+def detect_gate(frame, lane_roi):
+    """
+    Gate camera mode: no vehicle detection, the plate detector only looks at the fixed
+    lane region `lane_roi` ([x1, y1, x2, y2] relative to the frame size). Every plate
+    found stands for its own vehicle, so it is returned as a vehicle detection as well.
+    """
+    height, width = frame.shape[:2]
+    x1, y1, x2, y2 = clip_box([lane_roi[0] * width, lane_roi[1] * height,
+                               lane_roi[2] * width, lane_roi[3] * height], width, height)
+    license_plates = offset_boxes(cv_service.license_plate_detector([frame[y1:y2, x1:x2]])[0], x1, y1)
+    detections = [[*plate[:5], GATE_VEHICLE_CLASS] for plate in license_plates]
+    return detections, license_plates
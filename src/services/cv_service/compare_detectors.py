@@ -0,0 +1,102 @@
+"""
+Parity and latency comparison of the ultralytics and ONNX Runtime detector backends.
+
+    python -m src.services.cv_service.compare_detectors --images reads_on_car.jpg --runs 20
+"""
+import argparse
+import glob
+import json
+import time
+
+import cv2
+import numpy as np
+
+from src.conf.config import settings
+from src.services.cv_service.detectors import OnnxDetector, UltralyticsDetector, export_onnx
+
+
+def box_iou(a, b):
+    xx1, yy1 = max(a[0], b[0]), max(a[1], b[1])
+    xx2, yy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0., xx2 - xx1) * max(0., yy2 - yy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.
+
+
+def compare_boxes(reference, candidate, iou_threshold=0.5):
+    """
+    Greedily match candidate boxes to reference boxes of the same class.
+    """
+    unmatched = list(range(len(candidate)))
+    ious, score_diffs = [], []
+    for ref in reference:
+        best, best_iou = None, iou_threshold
+        for j in unmatched:
+            if int(candidate[j][5]) != int(ref[5]):
+                continue
+            iou = box_iou(ref, candidate[j])
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            unmatched.remove(best)
+            ious.append(best_iou)
+            score_diffs.append(abs(candidate[best][4] - ref[4]))
+    return {
+        'reference_boxes': len(reference),
+        'candidate_boxes': len(candidate),
+        'matched': len(ious),
+        'mean_iou': float(np.mean(ious)) if ious else None,
+        'min_iou': float(np.min(ious)) if ious else None,
+        'max_score_diff': float(np.max(score_diffs)) if score_diffs else None,
+    }
+
+
+def measure(detector, frames, runs):
+    detector(frames[:1])  # warm-up
+    timings = []
+    for _ in range(runs):
+        for frame in frames:
+            start = time.perf_counter()
+            detector([frame])
+            timings.append((time.perf_counter() - start) * 1000)
+    return {'mean_ms': float(np.mean(timings)), 'p50_ms': float(np.percentile(timings, 50)),
+            'p90_ms': float(np.percentile(timings, 90))}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare detector backends')
+    parser.add_argument('--weights', nargs='+', default=['yolov8n.pt', 'license_plate_detector.pt'])
+    parser.add_argument('--images', nargs='+', default=['reads_on_car.jpg'], help='Image files or glob patterns.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='Write the JSON report to this file.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    paths = [path for pattern in args.images for path in sorted(glob.glob(pattern))]
+    frames = [cv2.imread(path) for path in paths]
+    if not frames or any(frame is None for frame in frames):
+        raise SystemExit('No readable images given.')
+
+    report = {}
+    for weights in args.weights:
+        reference = UltralyticsDetector(weights)
+        candidate = OnnxDetector(export_onnx(weights, settings.onnx_cache_dir, settings.detector_imgsz),
+                                 settings.detector_imgsz, settings.onnx_threads)
+        report[weights] = {
+            'parity': {path: compare_boxes(ref, cand)
+                       for path, ref, cand in zip(paths, reference(frames), candidate(frames))},
+            'latency': {'ultralytics': measure(reference, frames, args.runs),
+                        'onnx': measure(candidate, frames, args.runs)},
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
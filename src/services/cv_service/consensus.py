@@ -0,0 +1,115 @@
+from collections import defaultdict
+
+from src.services.cv_service.results import PlateEvent, PlateRead
+
+
+class PlateConsensus:
+    """
+    Fusion of the OCR reads of one tracked vehicle.
+
+    Every read votes for its length and for the character at each position,
+    weighted by its `text_score`.
+    """
+
+    def __init__(self):
+        self.reads = 0
+        self.lengths = defaultdict(float)
+        self.positions = []
+        self.best_read: PlateRead | None = None
+
+    def add(self, read: PlateRead):
+        weight = max(float(read.text_score), 1e-6)
+        self.reads += 1
+        self.lengths[len(read.text)] += weight
+        for i, char in enumerate(read.text):
+            if i == len(self.positions):
+                self.positions.append(defaultdict(float))
+            self.positions[i][char] += weight
+        if self.best_read is None or read.text_score > self.best_read.text_score:
+            self.best_read = read
+
+    @property
+    def length(self) -> int:
+        return max(self.lengths, key=self.lengths.get) if self.lengths else 0
+
+    @property
+    def text(self) -> str:
+        return ''.join(max(votes, key=votes.get) for votes in self.positions[:self.length])
+
+    @property
+    def confidence(self) -> float:
+        """
+        Share of the vote won by the consensus length, times the mean share
+        won by the consensus character over its positions.
+        """
+        length = self.length
+        if not length:
+            return 0.
+        length_share = self.lengths[length] / sum(self.lengths.values())
+        char_shares = [max(votes.values()) / sum(votes.values()) for votes in self.positions[:length]]
+        return length_share * sum(char_shares) / length
+
+    def to_read(self) -> PlateRead:
+        best = self.best_read
+        return PlateRead(best.frame_nmr, best.car_id, best.car_bbox, best.plate_bbox, best.bbox_score,
+                         self.text, self.confidence)
+
+
+class TrackPlates:
+    """
+    Plate consensus for every vehicle track of a video.
+
+    A track stops being OCRed once its consensus is confirmed, and produces one
+    plate event when it has not been seen for more than `max_age` tracker updates.
+    Ages are counted in tracker updates, not video frames, so they stay in step
+    with SORT when frames are skipped.
+    """
+
+    def __init__(self, threshold: float = 0.8, min_reads: int = 3, max_age: int = 1):
+        self.threshold = threshold
+        self.min_reads = min_reads
+        self.max_age = max_age
+        self._tracks: dict[int, PlateConsensus] = {}
+        self._last_seen: dict[int, int] = {}
+        self._spans: dict[int, list[int]] = {}
+        self._tick = -1
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def confirmed(self, track_id) -> bool:
+        consensus = self._tracks.get(int(track_id))
+        return (consensus is not None and consensus.reads >= self.min_reads
+                and consensus.confidence >= self.threshold)
+
+    def seen(self, track_ids, frame_nmr: int):
+        """
+        Record the tracks returned by the tracker update of frame `frame_nmr`.
+        """
+        self._tick += 1
+        for track_id in track_ids:
+            track_id = int(track_id)
+            self._last_seen[track_id] = self._tick
+            self._spans.setdefault(track_id, [frame_nmr, frame_nmr])[1] = frame_nmr
+
+    def add(self, read: PlateRead):
+        track_id = int(read.car_id)
+        self._tracks.setdefault(track_id, PlateConsensus()).add(read)
+        self._last_seen[track_id] = self._tick
+        span = self._spans.setdefault(track_id, [read.frame_nmr, read.frame_nmr])
+        span[0], span[1] = min(span[0], read.frame_nmr), max(span[1], read.frame_nmr)
+
+    def pop_finished(self, final: bool = False) -> list[PlateEvent]:
+        """
+        Remove the lost tracks (every track when `final`) and return their plate events.
+        """
+        events = []
+        for track_id in list(self._last_seen):
+            if not final and self._tick - self._last_seen[track_id] <= self.max_age:
+                continue
+            del self._last_seen[track_id]
+            first_frame, last_frame = self._spans.pop(track_id)
+            consensus = self._tracks.pop(track_id, None)
+            if consensus is not None and consensus.text:
+                events.append(PlateEvent(track_id, consensus.to_read(), first_frame, last_frame, consensus.reads))
+        return events
@@ -0,0 +1,189 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from src.conf.config import settings
+
+
+# Same defaults as ultralytics predict()
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_WH = 7680  # class offset for class-aware NMS
+PAD_VALUE = 114
+
+
+class UltralyticsDetector:
+    """
+    YOLO model run through ultralytics / PyTorch.
+    Calling it with a list of frames returns [[x1, y1, x2, y2, score, class_id], ...] per frame.
+
+    ultralytics keeps the state of a prediction on the model's single predictor, so calls
+    from several threads (thread executor, cameras, the batcher) take turns on a lock.
+    """
+
+    def __init__(self, weights: str):
+        from ultralytics import YOLO
+
+        self.weights = weights
+        self.model = YOLO(weights)
+        self._lock = threading.Lock()
+
+    def __call__(self, frames):
+        with self._lock:
+            return [result.boxes.data.tolist() for result in self.model(frames)]
+
+
+def export_onnx(weights: str, cache_dir: str, imgsz: int = 640) -> str:
+    """
+    Export YOLO weights to ONNX once and return the path of the cached artifact.
+    The export is redone only when the weights are newer than the cached file. Like YOLO(),
+    a bare name of official weights that are not on disk is downloaded first.
+
+    Worker processes starting together all land here: the first one exports under a file
+    lock while the others wait for it and reuse its artifact. The export runs on a copy
+    of the weights in a private directory and is moved into place with os.replace, so a
+    half-written file is never visible.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    onnx_path = os.path.join(cache_dir, f"{stem}-{imgsz}.onnx")
+
+    def is_fresh():
+        return (os.path.exists(weights) and os.path.exists(onnx_path)
+                and os.path.getmtime(onnx_path) >= os.path.getmtime(weights))
+
+    if is_fresh():
+        return onnx_path
+
+    from filelock import FileLock
+
+    with FileLock(f"{onnx_path}.lock"):
+        if not os.path.exists(weights):
+            from ultralytics.yolo.utils.downloads import attempt_download_asset
+
+            weights = attempt_download_asset(weights)
+        if is_fresh():
+            return onnx_path
+
+        from ultralytics import YOLO
+
+        # ultralytics writes the export next to the weights it loaded
+        with tempfile.TemporaryDirectory(dir=cache_dir) as export_dir:
+            private_weights = shutil.copy(weights, export_dir)
+            exported = YOLO(private_weights).export(format='onnx', imgsz=imgsz, dynamic=True)
+            os.replace(exported, onnx_path)
+    return onnx_path
+
+
+def letterbox(frame, imgsz):
+    """
+    Resize keeping the aspect ratio and pad to a square `imgsz` input, like ultralytics' LetterBox.
+    Returns the padded image, the resize ratio and the (left, top) padding.
+    """
+    height, width = frame.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    dw, dh = (imgsz - new_width) / 2, (imgsz - new_height) / 2
+
+    if (new_width, new_height) != (width, height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    frame = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(PAD_VALUE,) * 3)
+    return frame, ratio, (left, top)
+
+
+def non_max_suppression(boxes, scores, iou_threshold):
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.maximum(0., xx2 - xx1) * np.maximum(0., yy2 - yy1)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+class OnnxDetector:
+    """
+    YOLOv8 model exported to ONNX and run with onnxruntime's CPU execution provider.
+    Produces the same box format as UltralyticsDetector.
+    """
+
+    def __init__(self, onnx_path: str, imgsz: int = 640, threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Batch dimension is symbolic when the model was exported with dynamic=True
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        self.imgsz = imgsz
+
+    def _preprocess(self, frame):
+        image, ratio, pad = letterbox(frame, self.imgsz)
+        image = image[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, HWC to CHW
+        return np.ascontiguousarray(image, dtype=np.float32) / 255., ratio, pad
+
+    def _postprocess(self, prediction, frame_shape, ratio, pad):
+        prediction = prediction.T  # (anchors, 4 + classes)
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+        mask = scores > CONF_THRESHOLD
+        if not mask.any():
+            return []
+
+        cx, cy, w, h = prediction[mask, :4].T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        scores, class_ids = scores[mask], class_ids[mask]
+
+        keep = non_max_suppression(boxes + class_ids[:, None] * MAX_WH, scores, IOU_THRESHOLD)[:MAX_DETECTIONS]
+        boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+
+        # Undo the letterbox and clip to the original frame
+        boxes -= [pad[0], pad[1], pad[0], pad[1]]
+        boxes /= ratio
+        height, width = frame_shape[:2]
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return np.column_stack([boxes, scores, class_ids]).tolist()
+
+    def __call__(self, frames):
+        prepared = [self._preprocess(frame) for frame in frames]
+        inputs = np.stack([image for image, _, _ in prepared])
+        if self.dynamic_batch:
+            predictions = self.session.run(None, {self.input_name: inputs})[0]
+        else:
+            predictions = np.concatenate([self.session.run(None, {self.input_name: image[None]})[0]
+                                          for image in inputs])
+        return [self._postprocess(prediction, frame.shape, ratio, pad)
+                for prediction, frame, (_, ratio, pad) in zip(predictions, frames, prepared)]
+
+
+def load_detector(weights: str, backend: str | None = None):
+    """
+    Build the detector for `weights` with the configured backend (`ultralytics` or `onnx`).
+    """
+    backend = backend or settings.detector_backend
+    if backend == 'ultralytics':
+        return UltralyticsDetector(weights)
+    if backend == 'onnx':
+        onnx_path = export_onnx(weights, settings.onnx_cache_dir, settings.detector_imgsz)
+        return OnnxDetector(onnx_path, settings.detector_imgsz, settings.onnx_threads)
+    raise ValueError(f"Unknown detector backend: {backend}")
@@ -0,0 +1,163 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from src.conf.config import settings
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+def init_worker(threads: int, warm_up: bool):
+    """
+    Runs once in every worker process: load the YOLO models and the OCR readers
+    so that recognition jobs never pay for model loading.
+    """
+    if threads > 0:
+        import cv2
+
+        cv2.setNumThreads(threads)
+        # Only the ultralytics backend runs on torch, onnxruntime has its own thread setting
+        if settings.detector_backend == 'ultralytics':
+            import torch
+
+            torch.set_num_threads(threads)
+
+    from src.services.cv_service.service import cv_service
+
+    cv_service.warm_up(ocr=warm_up)
+
+
+def _ping():
+    return True
+
+
+class RecognitionExecutor:
+    """
+    Runs plate recognition in a dedicated pool of worker processes, so YOLO,
+    OpenCV and easyocr never block the API event loop.
+
+    At most `workers + queue_size` jobs are accepted at a time; anything above
+    that is rejected with QueueFullError instead of piling up behind the pool. When a
+    worker process dies (e.g. killed for running out of memory) the pool is replaced
+    and the jobs that were in it fail with BrokenProcessPool.
+
+    In `thread` mode the jobs run in threads of the API process instead. The models
+    are then shared: every detector call of every DETECTOR_MODE is serialized by the
+    detector's lock, and in `full` mode concurrent requests can be batched by the
+    detection batcher.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 8, threads_per_worker: int = 0, mode: str = 'process'):
+        if workers < 1:
+            raise ValueError("Recognition executor needs at least one worker.")
+        if mode not in ('process', 'thread'):
+            raise ValueError(f"Unknown recognition executor mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        self.threads_per_worker = threads_per_worker
+        self._pool: Executor | None = None
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_time = 0.0
+        self._restarts = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    async def start(self):
+        if self._pool is not None:
+            return
+        if self.mode == 'thread':
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='recognition')
+            await asyncio.to_thread(init_worker, 0, settings.ocr_warm_up)
+            return
+
+        self._pool = self._new_process_pool()
+        # Spawn every worker now and wait until their models are loaded
+        await asyncio.gather(*(asyncio.wrap_future(self._pool.submit(_ping)) for _ in range(self.workers)))
+
+    def _new_process_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(self.threads_per_worker, settings.ocr_warm_up),
+        )
+
+    def _replace_broken_pool(self, pool: Executor):
+        # Every job of the failed request shares the broken pool, only the first one replaces it
+        if self._pool is not pool:
+            return
+        print("Recognition worker process died, restarting the recognition pool")
+        self._pool = self._new_process_pool()
+        self._restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def shutdown(self):
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    async def run(self, fn, *args):
+        """
+        Execute `fn(*args)` in a worker process and await its result.
+        `fn` and its arguments must be picklable.
+        """
+        if self._pool is None:
+            await self.start()
+        if self._pending >= self.capacity:
+            self._rejected += 1
+            raise QueueFullError("Recognition queue is full.")
+
+        self._pending += 1
+        self._submitted += 1
+        start = time.perf_counter()
+        pool = self._pool
+        try:
+            result = await asyncio.wrap_future(pool.submit(fn, *args))
+        except BrokenProcessPool:
+            self._failed += 1
+            self._replace_broken_pool(pool)
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        else:
+            self._completed += 1
+            return result
+        finally:
+            self._pending -= 1
+            self._busy_time += time.perf_counter() - start
+
+    def metrics(self) -> dict:
+        finished = self._completed + self._failed
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'capacity': self.capacity,
+            'pending': self._pending,
+            'submitted': self._submitted,
+            'completed': self._completed,
+            'failed': self._failed,
+            'rejected': self._rejected,
+            'restarts': self._restarts,
+            'avg_job_seconds': round(self._busy_time / finished, 4) if finished else 0.0,
+        }
+
+
+recognition_executor = RecognitionExecutor(
+    workers=settings.recognition_workers,
+    queue_size=settings.recognition_queue_size,
+    threads_per_worker=settings.recognition_threads_per_worker,
+    mode=settings.recognition_executor,
+)
@@ -0,0 +1,72 @@
+"""
+Import-time budget check for the API entry point.
+
+Imports `main` in a fresh interpreter with `-X importtime` and fails when the import
+takes longer than the budget or pulls in any of the heavy CV libraries, which must
+only be loaded by the CV service on first use or warm-up.
+
+    python -m src.services.cv_service.import_budget --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+HEAVY_MODULES = ('torch', 'torchvision', 'ultralytics', 'easyocr', 'onnxruntime',
+                 'matplotlib', 'skimage', 'filterpy', 'pandas')
+
+
+def measure_import(target: str = 'main', cwd: str | None = None) -> dict:
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+                          capture_output=True, text=True, cwd=cwd)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{proc.stderr[-2000:]}")
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        # "import time:  <self us> | <cumulative us> | <indented module name>"
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total_us = next((cumulative for name, _, cumulative in modules if name == target), 0)
+    loaded = {name.split('.')[0] for name, _, _ in modules}
+    slowest = sorted(modules, key=lambda module: module[2], reverse=True)[:15]
+    return {
+        'target': target,
+        'total_ms': round(total_us / 1000, 1),
+        'heavy_modules': sorted(loaded.intersection(HEAVY_MODULES)),
+        'slowest': [{'module': name, 'self_ms': round(self_us / 1000, 1), 'cumulative_ms': round(cumulative / 1000, 1)}
+                    for name, self_us, cumulative in slowest],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check the import-time budget of the API')
+    parser.add_argument('--target', default='main', help='Module to import.')
+    parser.add_argument('--budget-ms', type=float, default=1500.)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    report = measure_import(args.target, cwd=root)
+    report['budget_ms'] = args.budget_ms
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if report['total_ms'] > args.budget_ms:
+        failures.append(f"import of {args.target} took {report['total_ms']}ms, budget is {args.budget_ms}ms")
+    if report['heavy_modules']:
+        failures.append(f"heavy modules imported at startup: {', '.join(report['heavy_modules'])}")
+    if failures:
+        print('FAILED: ' + '; '.join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""
+Continuous plate recognition on the live cameras of the parking gates.
+
+Every camera configured in `settings.cameras` ({gate: stream URL, device index or file})
+is decoded in its own process into a shared-memory FrameRing. One pipeline thread takes
+the newest frame of every camera from the ring and runs it through the tracked
+detect/track/OCR path of recorded videos (lic_rec.PlateStream). The frames of a tick
+that pass their camera's motion gate share one detector pass and one batched
+TrackerManager update. Each plate event is
+passed to ParkingRecordRepository.handle_parking, which starts or ends the parking session.
+A local video file is looped and played at its own FPS, so it can stand in for a camera.
+
+Ingest runs as its own process next to the API, never inside the uvicorn workers, and a
+lock file keeps a second instance from recording every plate twice. It prints its metrics
+every minute.
+
+    python -m src.services.cv_service.ingest
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from src.conf.config import settings
+from src.services.cv_service.results import PlateEvent
+from src.services.cv_service.shm_ring import FrameRing, fit_frame
+from src.services.cv_service.trackers import TrackerManager
+
+
+def open_source(source: str):
+    # OpenCV takes camera devices as integer indices
+    return int(source) if str(source).isdigit() else source
+
+
+def decode_camera(ring: FrameRing, gate: str, source: str, status, stop, reconnect_delay: float = 1.,
+                  max_reconnect_delay: float = 30.):
+    """
+    Decoder process of one camera: decode the frames the motion gate can look at into the
+    ring, reopening the stream with exponential backoff whenever it fails or ends.
+    Like a camera, the decoder never waits for the pipeline: a frame that finds the ring
+    full is dropped. Connection changes and counters are reported as dicts on `status`.
+    """
+    from src.services.cv_service.motion import MotionGate
+    from src.services.cv_service.video_source import FramePrefetcher
+
+    looping = os.path.isfile(source)
+    delay = reconnect_delay
+    connections = 0
+    dropped = 0
+    try:
+        while not stop.is_set():
+            frames = None
+            try:
+                frames = FramePrefetcher(open_source(source), queue_size=2, live=True)
+                # Same stride as the motion gate of the pipeline, the other frames are only grabbed
+                frames.stride = MotionGate(frames.fps, settings.video_target_fps).active_stride
+                connections += 1
+                status.put({'gate': gate, 'connected': True, 'connections': connections, 'fps': frames.fps})
+                reported = time.monotonic()
+                for frame_nmr, frame in frames:
+                    if stop.is_set():
+                        break
+                    try:
+                        ring.put(gate, frame_nmr, fit_frame(frame, ring.frame_shape), timeout=0)
+                    except queue.Empty:
+                        dropped += 1
+                    delay = reconnect_delay
+                    if time.monotonic() - reported >= 1.:
+                        status.put({'gate': gate, 'frames_dropped': dropped})
+                        reported = time.monotonic()
+                if looping or stop.is_set():
+                    continue
+                error = "Stream ended."
+            except Exception as e:
+                error = str(e)
+            finally:
+                if frames is not None:
+                    frames.close()
+            status.put({'gate': gate, 'connected': False, 'last_error': error})
+            print(f"Camera {gate}: {error} Reconnecting in {delay:.1f}s")
+            stop.wait(delay)
+            delay = min(delay * 2, max_reconnect_delay)
+    finally:
+        ring.close()
+
+
+class Camera:
+    """
+    Decoder process of one gate camera and the counters reported for it.
+    """
+
+    def __init__(self, gate: str, source: str):
+        self.gate = gate
+        self.source = source
+        self.process = None
+        self.connected = False
+        self.connections = 0
+        self.source_fps = 0.
+        self.events = 0
+        self.frames = 0
+        self.frames_dropped = 0
+        self.decoder_dropped = 0
+        self.lag = None
+        self.last_error: str | None = None
+        self._connected_at = 0.
+
+    def update(self, status: dict):
+        if status.get('connected'):
+            self._connected_at = time.monotonic()
+            self.frames = 0
+        self.connected = status.get('connected', self.connected)
+        self.connections = status.get('connections', self.connections)
+        self.source_fps = status.get('fps', self.source_fps)
+        self.decoder_dropped = status.get('frames_dropped', self.decoder_dropped)
+        self.last_error = status.get('last_error', self.last_error)
+
+    def metrics(self) -> dict:
+        uptime = time.monotonic() - self._connected_at if self.connected else 0.
+        return {
+            'source': self.source,
+            'connected': self.connected,
+            'connections': self.connections,
+            'events': self.events,
+            'fps': round(self.frames / uptime, 2) if uptime else 0.,
+            'lag_seconds': round(self.lag, 3) if self.lag is not None else None,
+            'frames_dropped': self.frames_dropped + self.decoder_dropped,
+            'last_error': self.last_error,
+        }
+
+
+class IngestService:
+    """
+    Owns the camera decoders and the pipeline thread, and records the plate events on the
+    event loop it is started from.
+
+    The same plate seen again at the same gate within `dedup_seconds` is ignored, so a vehicle
+    whose track was split in two does not end the parking session it has just started.
+    """
+
+    def __init__(self, cameras: dict[str, str], dedup_seconds: float = 30.):
+        self.cameras = {gate: Camera(gate, source) for gate, source in cameras.items()}
+        self.dedup_seconds = dedup_seconds
+        self.recorded = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self._last_plates: dict[tuple[str, str], float] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._ring: FrameRing | None = None
+        self._status = None
+        self._stop = None
+        self._thread: threading.Thread | None = None
+        self.tracker_manager: TrackerManager | None = None
+
+    async def start(self):
+        if self._thread is not None:
+            return
+        from src.services.cv_service.service import cv_service
+
+        self._loop = asyncio.get_running_loop()
+        # Load the models once for all cameras before the first frame arrives
+        await asyncio.to_thread(cv_service.warm_up, settings.ocr_warm_up)
+
+        ctx = multiprocessing.get_context('spawn')
+        width, height = settings.frame_ring_max_size
+        # Every camera needs a slot for the frame in the pipeline and one being decoded
+        slots = max(settings.frame_ring_slots, 2 * len(self.cameras) + 1)
+        self._ring = FrameRing(slots, (height, width, 3), ctx)
+        self._status = ctx.Queue()
+        self._stop = ctx.Event()
+        for camera in self.cameras.values():
+            camera.process = ctx.Process(target=decode_camera, name=f'camera-{camera.gate}', daemon=True,
+                                         args=(self._ring, camera.gate, camera.source, self._status, self._stop,
+                                               settings.camera_reconnect_delay, settings.camera_reconnect_max_delay))
+            camera.process.start()
+        self._thread = threading.Thread(target=self._run, name='ingest-pipeline', daemon=True)
+        self._thread.start()
+
+    async def shutdown(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        await asyncio.to_thread(self._thread.join)
+        for camera in self.cameras.values():
+            await asyncio.to_thread(camera.process.join, 5)
+            if camera.process.is_alive():
+                camera.process.terminate()
+        self._thread = None
+        self._ring.close()
+
+    def _take_latest(self, timeout: float) -> dict:
+        """
+        Wait for a frame, then drain the ring and keep only the newest frame of every camera.
+        """
+        try:
+            items = [self._ring.take(timeout)]
+        except queue.Empty:
+            return {}
+        while True:
+            try:
+                items.append(self._ring.take(0))
+            except queue.Empty:
+                break
+        latest = {}
+        for item in items:
+            gate = item[1]
+            if gate in latest:
+                # The pipeline fell behind this camera, skip to its newest frame
+                self._ring.release(latest[gate][0])
+                self.cameras[gate].frames_dropped += 1
+            latest[gate] = item
+        return latest
+
+    def _read_status(self, streams: dict, tracker_manager):
+        while True:
+            try:
+                status = self._status.get_nowait()
+            except queue.Empty:
+                return
+            gate = status['gate']
+            if status.get('connected') and gate in streams:
+                # Frame numbers restart with a new connection, so do the tracks
+                self._reset_stream(gate, streams, tracker_manager)
+            self.cameras[gate].update(status)
+
+    def _reset_stream(self, gate: str, streams: dict, tracker_manager):
+        tracker_manager.remove(gate)
+        stream = streams.pop(gate, None)
+        if stream is not None:
+            for event in stream.finish():
+                self._on_event(gate, event)
+
+    def _run(self):
+        from src.services.cv_service.lic_rec import PlateStream, detect_scaled_batch, vehicles
+
+        streams = {}
+        tracked = set()
+        self.tracker_manager = TrackerManager(settings.track_max_age, settings.track_min_hits)
+        while not self._stop.is_set():
+            self._read_status(streams, self.tracker_manager)
+            frames = self._take_latest(timeout=0.1)
+            try:
+                gated = {}
+                for gate, (_, _, frame_nmr, decoded_at, frame) in frames.items():
+                    camera = self.cameras[gate]
+                    camera.frames += 1
+                    camera.lag = time.time() - decoded_at
+                    stream = streams.get(gate)
+                    if stream is None:
+                        scale = settings.camera_detection_scales.get(gate, settings.detection_scale)
+                        stream = streams[gate] = PlateStream(camera.source_fps, vehicles, scale)
+                    if stream.motion_gate.should_process(frame_nmr, frame):
+                        gated[gate] = (frame_nmr, frame)
+
+                # One detector pass for the frames of all cameras in this tick
+                results = detect_scaled_batch([frame for _, frame in gated.values()],
+                                              [streams[gate].scale for gate in gated])
+                detections = {gate: (frame_nmr, frame, *streams[gate].vehicle_boxes(*result))
+                              for (gate, (frame_nmr, frame)), result in zip(gated.items(), results)}
+
+                # One Kalman predict / update batch for the cameras of this tick
+                tracks = self.tracker_manager.update({gate: vehicle_detections for gate, (_, _, vehicle_detections, _)
+                                                      in detections.items()})
+                for gate, (frame_nmr, frame, _, license_plates) in detections.items():
+                    for event in streams[gate].read_plates(frame, frame_nmr, tracks[gate], license_plates):
+                        self._on_event(gate, event)
+
+                # Cameras idle for longer than the manager keeps their tracker start over
+                tracked.update(detections)
+                for gate in [gate for gate in tracked if gate not in self.tracker_manager]:
+                    tracked.discard(gate)
+                    self._reset_stream(gate, streams, self.tracker_manager)
+            except Exception as e:
+                print(f"Ingest pipeline error: {e}")
+            finally:
+                for slot, *_ in frames.values():
+                    self._ring.release(slot)
+
+    def _on_event(self, gate: str, event: PlateEvent):
+        # Called from the pipeline thread
+        self.cameras[gate].events += 1
+        asyncio.run_coroutine_threadsafe(self.record(gate, event), self._loop)
+
+    async def record(self, gate: str, event: PlateEvent):
+        from src.database.db import sessionmanager
+        from src.models.models import ParkingRecord
+        from src.repository.users import ParkingRecordRepository
+        from src.services.cv_service.util import sanitize_license_plate
+
+        license_plate = sanitize_license_plate(event.read.text)
+        now = time.monotonic()
+        # Forget the plates seen before the dedup window, so the dict does not grow for ever
+        self._last_plates = {key: seen for key, seen in self._last_plates.items()
+                             if now - seen < self.dedup_seconds}
+        if (gate, license_plate) in self._last_plates:
+            self.duplicates += 1
+            return
+        self._last_plates[(gate, license_plate)] = now
+
+        try:
+            async with sessionmanager.session() as db:
+                record = await ParkingRecordRepository(db).handle_parking(license_plate)
+        except ValueError as e:
+            self.rejected += 1
+            print(f"Gate {gate}: {license_plate} rejected: {e}")
+            return
+        except Exception as e:
+            self.rejected += 1
+            print(f"Gate {gate}: could not record {license_plate}: {e}")
+            return
+        self.recorded += 1
+        print(f"Gate {gate}: {license_plate} {'exit' if isinstance(record, ParkingRecord) else 'entry'}")
+
+    def metrics(self) -> dict:
+        return {
+            'recorded': self.recorded,
+            'rejected': self.rejected,
+            'duplicates': self.duplicates,
+            'trackers': self.tracker_manager.metrics() if self.tracker_manager is not None else None,
+            'cameras': {gate: camera.metrics() for gate, camera in self.cameras.items()},
+        }
+
+
+ingest_service = IngestService(settings.cameras, settings.ingest_dedup_seconds)
+
+
+async def run_forever():
+    await ingest_service.start()
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(ingest_service.metrics())
+    finally:
+        await ingest_service.shutdown()
+
+
+if __name__ == '__main__':
+    from filelock import FileLock, Timeout
+
+    if not settings.cameras:
+        raise SystemExit("No cameras configured, set CAMERAS to a JSON object of {gate: source}.")
+    try:
+        with FileLock(settings.ingest_lock_file, timeout=0):
+            asyncio.run(run_forever())
+    except Timeout:
+        raise SystemExit(f"Ingest is already running, {settings.ingest_lock_file} is locked.")
@@ -1,10 +1,9 @@
-import datetime
+import os
 
-from src.services.cv_service.sort.sort import *
-from .lic_rec import *
-from src.services.cv_service.visualize_image import draw_bboxes_from_csv
-from src.services.cv_service.util import write_csv
-from src.utils import utils
+from src.services.cv_service.lic_rec import process_image, process_video_or_image, vehicles
+from src.conf.config import settings
+from src.services.cv_service.results import RecognitionResult, export_results
+from src.services.cv_service.visualize_image import draw_plate_reads
 
 
 
@@ -22,18 +21,37 @@ def is_video_file(file_path):
 def is_image_file(file_path):
     return file_path.lower().endswith(IMAGE_FORMATS)
 
+def export_if_configured(results):
+    # Exporting is an optional sink, it is not needed to answer the request
+    if settings.cv_results_sink:
+        export_results(results, settings.cv_results_sink)
+
+
 def main(input_source):
     if is_video_file(input_source):
         print(f"Detected {input_source} as a video file.")
         s_type = 'vid'
         results = process_video_or_image(input_source, vehicles, s_type)
-        write_csv(results, './reads.csv')
+        export_if_configured(results)
     elif is_image_file(input_source):
         s_type = 'pic'
         print(f"Detected {input_source} as an image file.")
-        results = process_video_or_image(input_source, vehicles, s_type)
-        write_csv(results, './reads.csv')
-        draw_bboxes_from_csv(input_source, 'reads.csv', output_path)
+        results = RecognitionResult()
+        frame, scale = process_image(input_source, vehicles, results)
+        export_if_configured(results)
+        draw_plate_reads(frame, results, output_path, scale)
     else:
         print(f"File format not recognized as video or image.")
-    return results[0][list(results[0].keys())[0]]['license_plate']['text']
\ No newline at end of file
+    return results.plate_text()
+
+
+def main_from_bytes(data):
+    """
+    Recognize the plate on an uploaded image given as raw encoded bytes or a buffer.
+    The image is decoded in memory, nothing is written to a temporary file.
+    """
+    results = RecognitionResult()
+    frame, scale = process_image(data, vehicles, results)
+    export_if_configured(results)
+    draw_plate_reads(frame, results, output_path, scale)
+    return results.plate_text()
@@ -1,100 +1,449 @@
-from ultralytics import YOLO
+import time
+from dataclasses import dataclass
+
 import cv2
+import numpy as np
 
-from src.services.cv_service.sort.sort import *
-from src.services.cv_service.util import get_car, read_license_plate
+from src.conf.config import settings
+from src.services.cv_service.batcher import detection_batcher
+from src.services.cv_service.cascade import detect_cascade, detect_gate
+from src.services.cv_service.consensus import TrackPlates
+from src.services.cv_service.motion import MotionGate
+from src.services.cv_service.ocr_backends import ocr_backend
+from src.services.cv_service.preprocess import StageStats, preprocess_plate_crop
+from src.services.cv_service.results import PlateEvent, PlateRead, RecognitionResult
+from src.services.cv_service.service import cv_service
+from src.services.cv_service.sort.sort import Sort
+from src.services.cv_service.util import assign_plates_to_cars
+from src.services.cv_service.video_source import FramePrefetcher
 
 
+vehicles = [2, 3, 5, 7]
 
-results = {}
+DETECTOR_MODES = ('full', 'cascade', 'gate')
 
-# load models
-coco_model = YOLO('yolov8n.pt') #for cars detection
-license_plate_detector = YOLO('license_plate_detector.pt') #for license plates detection
+# Detection latency per detector mode
+detection_stats = StageStats()
 
-vehicles = [2, 3, 5, 7]
+# Reduced-scale decode flags by downscale factor: the JPEG decoder downscales while decoding
+REDUCED_DECODE_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+@dataclass(slots=True)
+class PlateCrop:
+    frame_nmr: int
+    car_id: float
+    car_bbox: list
+    plate_bbox: list
+    bbox_score: float
+    image: np.ndarray
+
+
+def collect_plate_crops(frame, frame_nmr, license_plates, detections_, skip_car=None):
+    """
+    Assign detected plates to vehicles and return the preprocessed crops of the accepted ones.
+    Plates assigned to a vehicle for which `skip_car(car_id)` is true are dropped.
+    """
+    crops = []
+    # Assign license plates to cars
+    car_indices = assign_plates_to_cars(license_plates, detections_)
+    for license_plate, car_indx in zip(license_plates, car_indices):
+        x1, y1, x2, y2, score, class_id = license_plate
+
+        if car_indx != -1:
+            xcar1, ycar1, xcar2, ycar2, car_id = detections_[car_indx]
+            if skip_car is not None and skip_car(car_id):
+                continue
+            # Crop license plate
+            license_plate_crop = frame[int(y1):int(y2), int(x1): int(x2), :]
+            if license_plate_crop.size == 0:
+                continue
+
+            crops.append(PlateCrop(frame_nmr, car_id, [xcar1, ycar1, xcar2, ycar2], [x1, y1, x2, y2], score,
+                                   preprocess_plate_crop(license_plate_crop)))
+    return crops
+
+
+def recognize_plate_crops(crops, results):
+    """
+    Read all plate crops, from one frame or several, in a single batched OCR call
+    and add the reads to `results`. Returns the batch timing.
+    """
+    reads, timing = ocr_backend.read_batch([crop.image for crop in crops])
+    print(f"OCR batch: {timing['crops']} plates, {timing['lines']} lines in {timing['seconds']:.3f}s")
+
+    for crop, (license_plate_text, license_plate_text_score) in zip(crops, reads):
+        print(license_plate_text)
+        if license_plate_text is not None:
+            results.add(PlateRead(crop.frame_nmr, crop.car_id, crop.car_bbox, crop.plate_bbox, crop.bbox_score,
+                                  license_plate_text, license_plate_text_score))
+    return timing
+
+
+def detect_frames(frames):
+    """
+    Run both detectors over a batch of frames.
+    Returns a (vehicle detections, license plates) pair of box lists per frame.
+    """
+    return list(zip(cv_service.coco_model(frames), cv_service.license_plate_detector(frames)))
+
+
+def detect_frame(frame):
+    """
+    Detect the vehicles and plates of one frame with the configured DETECTOR_MODE:
+    `full` runs both detectors on the whole frame, `cascade` searches plates only inside
+    the detected vehicles and `gate` searches plates only in the fixed lane region.
+    """
+    mode = settings.detector_mode
+    start = time.perf_counter()
+    if mode == 'cascade':
+        result = detect_cascade(frame, vehicles)
+    elif mode == 'gate':
+        result = detect_gate(frame, settings.gate_lane_roi)
+    elif mode == 'full':
+        if settings.detector_batching:
+            # Share the detector pass with frames submitted concurrently by other callers
+            result = detection_batcher.detect(frame)
+        else:
+            result = detect_frames([frame])[0]
+    else:
+        raise ValueError(f"Unknown detector mode: {mode}, expected one of {DETECTOR_MODES}")
+    detection_stats.record({mode: time.perf_counter() - start})
+    return result
+
+
+def scale_boxes(boxes, factor):
+    return [[x1 * factor, y1 * factor, x2 * factor, y2 * factor, *rest] for x1, y1, x2, y2, *rest in boxes]
+
+
+def resize_for_detection(frame, scale):
+    if scale == 1:
+        return frame
+    return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def unscale_result(result, scale):
+    if scale == 1:
+        return result
+    detections, license_plates = result
+    return scale_boxes(detections, 1 / scale), scale_boxes(license_plates, 1 / scale)
+
+
+def detect_scaled(frame, scale=1.0):
+    """
+    Run the detectors on a copy of `frame` resized by `scale` and return the boxes in
+    `frame` coordinates.
+    """
+    return unscale_result(detect_frame(resize_for_detection(frame, scale)), scale)
+
+
+def detect_scaled_batch(frames, scales):
+    """
+    detect_scaled for frames of several streams at once, each resized by its own scale.
+    In `full` mode all of them go through one detector pass, the other modes detect the
+    frames one by one.
+    """
+    if not frames:
+        return []
+    smalls = [resize_for_detection(frame, scale) for frame, scale in zip(frames, scales)]
+    if settings.detector_mode == 'full':
+        start = time.perf_counter()
+        results = detect_frames(smalls)
+        detection_stats.record({'full': time.perf_counter() - start})
+    else:
+        results = [detect_frame(small) for small in smalls]
+    return [unscale_result(result, scale) for result, scale in zip(results, scales)]
 
 
 # Function to process frame (for both video and image)
-def process_frame(frame, frame_nmr, results, vehicles):
+def process_frame(frame, frame_nmr, results, vehicles, scale=1.0, full_frame=None):
+    """
+    Detect the vehicles and plates of `frame` and add the plate reads to `results`.
 
-    results[frame_nmr] = {}
-    # Detect vehicles
-    detections = coco_model(frame)[0]
+    With `scale` < 1, `frame` is a downscaled copy of the image: boxes are mapped back to
+    full resolution and the plates are cropped from `full_frame`, an array or a function
+    that loads it. The function is only called when some plate lies in a vehicle.
+    """
+
+    # Detect vehicles and license plates
+    detections, license_plates = detect_frame(frame)
+    if scale != 1:
+        detections, license_plates = scale_boxes(detections, 1 / scale), scale_boxes(license_plates, 1 / scale)
     detections_ = []
-    for detection in detections.boxes.data.tolist():
+    for detection in detections:
         x1, y1, x2, y2, score, class_id = detection
         if int(class_id) in vehicles:  # Ensure vehicles is a list of class IDs for vehicles
             detections_.append([x1, y1, x2, y2, score])
 
+    if full_frame is None:
+        full_frame = frame
+    elif callable(full_frame):
+        # Only decode the full resolution image when a plate has to be cropped from it
+        if not (assign_plates_to_cars(license_plates, detections_) >= 0).any():
+            return
+        full_frame = full_frame()
 
-    # Detect license plates
-    license_plates = license_plate_detector(frame)[0]
-    for license_plate in license_plates.boxes.data.tolist():
-        x1, y1, x2, y2, score, class_id = license_plate
+    crops = collect_plate_crops(full_frame, frame_nmr, license_plates, detections_)
+    if crops:
+        recognize_plate_crops(crops, results)
 
-        # Assign license plate to car
-        xcar1, ycar1, xcar2, ycar2, car_id = get_car(license_plate, detections_)
 
-        if car_id != -1:
-            # Crop license plate
-            license_plate_crop = frame[int(y1):int(y2), int(x1): int(x2), :]
+class PlateStream:
+    """
+    Tracked plate recognition state of one video stream: its motion gate, the plate
+    consensus of its tracks and its counters.
+
+    A frame goes through `detect`, the tracker of the stream, then `read_plates`, which
+    returns the plate events of the tracks that ended. Keeping the detector and the
+    tracker outside lets several streams share one detector pass and one batched tracker
+    update per tick: `motion_gate` and `vehicle_boxes` are the two halves of `detect`.
+    """
+
+    def __init__(self, fps: float, vehicles=vehicles, scale: float = 1.0):
+        self.vehicles = vehicles
+        self.scale = scale
+        self.motion_gate = MotionGate(fps, settings.video_target_fps, settings.video_idle_fps,
+                                      settings.motion_roi, settings.motion_threshold, settings.motion_hold_seconds,
+                                      settings.motion_method)
+        self.track_plates = TrackPlates(settings.track_consensus_threshold, settings.track_consensus_min_reads,
+                                        settings.track_max_age)
+        self.events = 0
+        self.ocr_calls = 0
+
+    def detect(self, frame_nmr, frame):
+        """
+        Returns the (n, 5) vehicle detections and the license plates of the frame, or None
+        when the motion gate skips it. Detection runs on the frame resized by `scale`.
+        """
+        if not self.motion_gate.should_process(frame_nmr, frame):
+            return None
+        return self.vehicle_boxes(*detect_scaled(frame, self.scale))
+
+    def vehicle_boxes(self, detections, license_plates):
+        """
+        Keep the vehicles among the detector output, as the (n, 5) array the tracker takes.
+        """
+        vehicle_detections = [detection[:5] for detection in detections if int(detection[5]) in self.vehicles]
+        return np.asarray(vehicle_detections, dtype=float).reshape(-1, 5), license_plates
+
+    def read_plates(self, frame, frame_nmr, tracks, license_plates) -> list[PlateEvent]:
+        """
+        Feed the plate reads of the not yet confirmed `tracks` into the track consensus and
+        return the events of the tracks that ended.
+        """
+        self.track_plates.seen(tracks[:, 4], frame_nmr)
+
+        # Plates are matched against every track, so a confirmed car's plate cannot go to
+        # an overlapping open track, and then not read again for confirmed tracks
+        crops = collect_plate_crops(frame, frame_nmr, license_plates, tracks.tolist(),
+                                    skip_car=self.track_plates.confirmed)
+        if crops:
+            reads = RecognitionResult()
+            recognize_plate_crops(crops, reads)
+            for read in reads:
+                self.track_plates.add(read)
+            self.ocr_calls += len(crops)
+        return self._count(self.track_plates.pop_finished())
+
+    def finish(self) -> list[PlateEvent]:
+        """
+        End every open track, e.g. at the end of the video or when the stream is reset.
+        """
+        return self._count(self.track_plates.pop_finished(final=True))
+
+    def _count(self, events):
+        events = list(events)
+        self.events += len(events)
+        return events
+
+
+def iter_plate_reads(input_source, vehicles=vehicles, start_frame=0, end_frame=None, stats=None, scale=None,
+                     count_from=None):
+    """
+    Track vehicles through frames [start_frame, end_frame) of a video with SORT and key
+    plate reads by track ID. Yields one PlateEvent per track, fused from its OCR results,
+    as soon as the track is lost, so memory does not grow with the video length.
+
+    Frames are only decoded ahead up to the prefetch queue size: when the consumer stops
+    pulling, decoding stops too. `input_source` can also be a ready FramePrefetcher, e.g. a
+    live one. Detection runs on frames resized by `scale` (DETECTION_SCALE by default),
+    plates are cropped at full resolution. The counters of the run are written into
+    `stats` at the end; frames before `count_from` (the overlap of a video segment) are
+    tracked but left out of the frame counters.
+
+    A motion gate decides which frames are analysed: frames are sampled at the target
+    analysis FPS while there is motion in the ROI, and at the idle FPS otherwise.
+    """
+    scale = settings.detection_scale if scale is None else scale
+    mot_tracker = Sort(max_age=settings.track_max_age, min_hits=settings.track_min_hits, own_ids=True)
+    warmup_processed = 0
+
+    # Frames are decoded ahead on a background thread, the ones the gate never looks at are only grabbed
+    if isinstance(input_source, FramePrefetcher):
+        frames = input_source
+    else:
+        frames = FramePrefetcher(input_source, queue_size=settings.video_prefetch_frames,
+                                 start_frame=start_frame, end_frame=end_frame)
+    stream = PlateStream(frames.fps, vehicles, scale)
+    motion_gate = stream.motion_gate
+    frames.stride = motion_gate.active_stride
+
+    try:
+        for frame_nmr, frame in frames:
+            detection = stream.detect(frame_nmr, frame)
+            if detection is None:
+                continue
+            if count_from is not None and frame_nmr < count_from:
+                warmup_processed += 1
+            vehicle_detections, license_plates = detection
+            tracks = mot_tracker.update(vehicle_detections)
+            yield from stream.read_plates(frame, frame_nmr, tracks, license_plates)
+
+        yield from stream.finish()
+    finally:
+        frames.close()
+
+    motion_gate.skip(frames.frames_read - motion_gate.frames_processed - motion_gate.frames_skipped)
+    if stats is not None:
+        stats.update(motion_gate.stats(), frames=frames.frames_read, plates_ocred=stream.ocr_calls)
+        if count_from is not None:
+            warmup_frames = min(frames.frames_read, max(0, count_from - start_frame))
+            stats['frames'] -= warmup_frames
+            stats['frames_processed'] -= warmup_processed
+            stats['frames_skipped'] -= warmup_frames - warmup_processed
+    print(f"Processed {motion_gate.frames_processed} of {frames.frames_read} frames "
+          f"({motion_gate.frames_skipped} skipped): {stream.events} plate events, {stream.ocr_calls} plates OCRed")
+
+
+def run_video_pipeline(input_source, vehicles, start_frame=0, end_frame=None, count_from=None):
+    """
+    Collect the plate events of iter_plate_reads. Returns the events and the counters of the run.
+    """
+    stats = {}
+    events = list(iter_plate_reads(input_source, vehicles, start_frame, end_frame, stats, count_from=count_from))
+    return events, stats
+
+
+def process_video(input_source, vehicles, results):
+    for event in iter_plate_reads(input_source, vehicles, stats=results.stats):
+        results.add(event.read)
+
+
+def read_image(input_source, flags=cv2.IMREAD_COLOR):
+    """
+    Load an image from a file path, or decode it straight from memory when given
+    the encoded bytes (or any buffer) of an upload.
+    """
+    if isinstance(input_source, (bytes, bytearray, memoryview)):
+        frame = cv2.imdecode(np.frombuffer(input_source, dtype=np.uint8), flags)
+    else:
+        frame = cv2.imread(input_source, flags)
+    if frame is None:
+        raise ValueError("Failed to read image.")
+    return frame
+
+
+def read_header(input_source, size=1 << 18) -> bytes:
+    """
+    The first `size` bytes of a file path or encoded buffer, empty when the file cannot be read.
+    """
+    if isinstance(input_source, (bytes, bytearray, memoryview)):
+        return bytes(input_source[:size])
+    try:
+        with open(input_source, 'rb') as f:
+            return f.read(size)
+    except OSError:
+        return b''
+
+
+def jpeg_size(header: bytes):
+    """
+    (height, width) from the frame header of a JPEG, None when it is not in `header`.
+    """
+    i = 2
+    while i + 9 <= len(header):
+        if header[i] != 0xFF:
+            return None
+        marker = header[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            i += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return int.from_bytes(header[i + 5:i + 7], 'big'), int.from_bytes(header[i + 7:i + 9], 'big')
+        i += 2 + int.from_bytes(header[i + 2:i + 4], 'big')
+    return None
+
+
+def read_image_scaled(input_source, max_side=None):
+    """
+    Decode an image for detection, downscaled by the largest factor of 2, 4 or 8 that
+    keeps its longest side at least `max_side` (DETECTION_MAX_SIDE by default, 0 for
+    full resolution). JPEGs are decoded straight at the reduced scale, other formats are
+    decoded once at full resolution and resized.
+    Returns the image, its scale relative to the full resolution image, and the full
+    resolution image when it was decoded along the way (None otherwise).
+    """
+    max_side = settings.detection_max_side if max_side is None else max_side
+    header = read_header(input_source)
+    if not max_side or not header.startswith(b'\xff\xd8\xff'):
+        image = read_image(input_source)
+        factor = max((factor for factor in (1, 2, 4, 8) if max_side and max(image.shape[:2]) / factor >= max_side),
+                     default=1)
+        if factor == 1:
+            return image, 1.0, image
+        height, width = image.shape[:2]
+        small = cv2.resize(image, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+        return small, 1 / factor, image
+
+    # The JPEG frame header tells the size of the full image, else a cheap 1/8 scale decode does
+    thumbnail = None
+    size = jpeg_size(header)
+    if size is None:
+        thumbnail = read_image(input_source, cv2.IMREAD_REDUCED_COLOR_8)
+        size = [side * 8 for side in thumbnail.shape[:2]]
+    factor = max((factor for factor in (1, 2, 4, 8) if max(size) / factor >= max_side), default=1)
+    if factor == 8:
+        return thumbnail if thumbnail is not None else read_image(input_source, REDUCED_DECODE_FLAGS[8]), 1 / 8, None
+    if factor == 1:
+        image = read_image(input_source)
+        return image, 1.0, image
+    return read_image(input_source, REDUCED_DECODE_FLAGS[factor]), 1 / factor, None
+
+
+def process_image(input_source, vehicles, results):
+    """
+    Recognize the plates of an image file or encoded image. Detection runs on a reduced
+    scale decode, the full resolution image is only decoded to crop the plates when it
+    was not decoded already.
+    Returns the decoded detection image and its scale.
+    """
+    image, scale, full_image = read_image_scaled(input_source)
+    process_frame(image, 0, results, vehicles, scale,
+                  full_image if full_image is not None else lambda: read_image(input_source))
+    return image, scale
 
-            # Process license plate
-            license_plate_crop_ = cv2.cvtColor(license_plate_crop, cv2.COLOR_BGR2GRAY)
-
-            # kernel = np.ones((1, 1), np.uint8)
-            # license_plate_crop_ = cv2.dilate(license_plate_crop, kernel, iterations=1)  #license_plate_dilate
-            # license_plate_crop_ = cv2.erode(license_plate_crop_gray, kernel, iterations=1)    #license_plate_erode 
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-
-            # Apply CLAHE to the grayscale image
-            enhanced_image = clahe.apply(license_plate_crop_)
-            #license_plate_crop_ = cv2.adaptiveThreshold(license_plate_crop_, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-            license_plate_crop__ = cv2.equalizeHist(enhanced_image)
-            license_plate_crop___ = cv2.fastNlMeansDenoising(license_plate_crop__, None, 30, 7, 21)
-            #_, license_plate_crop_ = cv2.threshold(license_plate_crop_gray, 64, 255, cv2.THRESH_BINARY)
-
-            # Read license plate number
-            license_plate_text, license_plate_text_score = read_license_plate(license_plate_crop___)
-            print(license_plate_text)
-            # cv2.imshow("Image", license_plate_crop_)
-            # cv2.waitKey(0)
-
-            if license_plate_text is not None:
-                results[frame_nmr][car_id] = {
-                    'car': {'bbox': [xcar1, ycar1, xcar2, ycar2]},
-                    'license_plate': {
-                        'bbox': [x1, y1, x2, y2],
-                        'text': license_plate_text,
-                        'bbox_score': score,
-                        'text_score': license_plate_text_score
-                    }
-                }
 
 # Main function to handle video or image
 def process_video_or_image(input_source, vehicles, s_type):
-    results = {}
-    frame_nmr = -1
+    results = RecognitionResult()
     
     if s_type=='vid':
         # Video processing
-        vid = cv2.VideoCapture(input_source)
-        ret = True
-        while ret:
-            frame_nmr += 1
-            ret, frame = vid.read()
-            if ret:
-                process_frame(frame, 0, results, vehicles)
-        vid.release()
+        process_video(input_source, vehicles, results)
 
     elif s_type=='pic':
         # Image processing
         # frame_nmr = 0
-        frame = cv2.imread(input_source)
-        if frame is None:
-            raise ValueError("Failed to read image.")
-        process_frame(frame, 0, results, vehicles)
+        process_image(input_source, vehicles, results)
+
+    elif s_type=='frame':
+        # Already decoded image
+        process_frame(input_source, 0, results, vehicles)
     else:
         print("Could not read the file.")
 
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap pre-filter deciding which frames of a static gate camera go through detection.
+
+    Frames are looked at with the target analysis FPS. Each looked-at frame is reduced
+    to a small blurred grayscale image of the ROI and compared with the previous one
+    (frame difference) or fed to a MOG2 background subtractor. While motion is present,
+    and for `hold_seconds` after it stops, frames are analysed at `target_fps`.
+    Otherwise the gate drops back to idle sampling at `idle_fps`.
+    """
+
+    def __init__(self, source_fps: float, target_fps: float = 5., idle_fps: float = 1.,
+                 roi: list[float] | None = None, threshold: float = 0.01, hold_seconds: float = 2.,
+                 method: str = 'diff', width: int = 160, pixel_threshold: int = 25):
+        if method not in ('diff', 'mog2'):
+            raise ValueError(f"Unknown motion detection method: {method}")
+        source_fps = source_fps if source_fps and source_fps > 0 else 30.
+        self.active_stride = max(1, int(round(source_fps / target_fps))) if target_fps > 0 else 1
+        # Only active-stride frames are looked at, so the idle stride must be a multiple of it
+        self.idle_stride = self.active_stride * max(1, int(round(source_fps / idle_fps / self.active_stride))) \
+            if idle_fps > 0 else 0
+        self.hold_frames = int(hold_seconds * source_fps)
+        self.roi = roi or [0., 0., 1., 1.]
+        self.threshold = threshold
+        self.method = method
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self._previous = None
+        self._subtractor = cv2.createBackgroundSubtractorMOG2(history=200, detectShadows=False) \
+            if method == 'mog2' else None
+        self._motion_until = -1
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.motion_checks = 0
+
+    def _small_roi(self, frame):
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = self.roi
+        roi = frame[int(y1 * height):int(y2 * height), int(x1 * width):int(x2 * width)]
+        scale = self.width / max(roi.shape[1], 1)
+        small = cv2.resize(roi, (self.width, max(int(roi.shape[0] * scale), 1)), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def motion_score(self, frame) -> float:
+        """
+        Fraction of ROI pixels that changed.
+        """
+        self.motion_checks += 1
+        small = self._small_roi(frame)
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(small)
+        else:
+            previous, self._previous = self._previous, small
+            if previous is None or previous.shape != small.shape:
+                return 1.
+            mask = cv2.absdiff(small, previous) > self.pixel_threshold
+        return float(np.count_nonzero(mask)) / mask.size
+
+    def in_motion(self, frame_nmr: int) -> bool:
+        return frame_nmr <= self._motion_until
+
+    def should_process(self, frame_nmr: int, frame) -> bool:
+        if frame_nmr % self.active_stride:
+            process = False
+        else:
+            if self.motion_score(frame) >= self.threshold:
+                self._motion_until = frame_nmr + self.hold_frames
+            process = self.in_motion(frame_nmr) or (self.idle_stride > 0 and frame_nmr % self.idle_stride == 0)
+
+        if process:
+            self.frames_processed += 1
+        else:
+            self.frames_skipped += 1
+        return process
+
+    def skip(self, frames: int):
+        """
+        Count frames that were dropped before reaching the gate, e.g. only grabbed by the decoder.
+        """
+        self.frames_skipped += max(0, frames)
+
+    def stats(self) -> dict:
+        return {
+            'frames_processed': self.frames_processed,
+            'frames_skipped': self.frames_skipped,
+            'motion_checks': self.motion_checks,
+            'active_stride': self.active_stride,
+            'idle_stride': self.idle_stride,
+        }
@@ -0,0 +1,184 @@
+"""
+Pluggable OCR backends for plate crops.
+
+Every backend has `read_batch(crops)`, which reads a list of preprocessed grayscale plate
+crops and returns their (text, score) reads, (None, None) when nothing was read, together
+with the timing of the batch. `warm_up()` loads the model ahead of the first request.
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from src.conf.config import settings
+from src.services.cv_service.ocr_pool import reader_pool
+from src.services.cv_service.util import (dict_char_to_int, dict_int_to_char, plate_line_boxes,
+                                          read_license_plates_batch)
+
+
+OCR_BACKENDS = ('easyocr', 'crnn')
+
+
+class EasyOcrBackend:
+    """
+    The general easyocr ['en', 'uk'] model, with the plate heuristics of util. Readers
+    come from the shared reader pool.
+    """
+    name = 'easyocr'
+
+    def read_batch(self, crops):
+        # Borrow a shared OCR reader for the whole batch
+        with reader_pool.borrow(timeout=settings.ocr_borrow_timeout) as reader:
+            return read_license_plates_batch(crops, reader)
+
+    def warm_up(self):
+        reader_pool.warm_up()
+
+    def metrics(self) -> dict:
+        return {'backend': self.name, 'pool': reader_pool.metrics()}
+
+
+def ctc_greedy_decode(probabilities, alphabet):
+    """
+    Best path decoding of (T, C) CTC probabilities, class 0 being the blank.
+    Returns the text and the mean probability of its characters.
+    """
+    best = probabilities.argmax(axis=1)
+    keep = (best != 0) & np.concatenate([[True], best[1:] != best[:-1]])
+    if not keep.any():
+        return '', 0.
+    text = ''.join(alphabet[i - 1] for i in best[keep])
+    score = float(probabilities[np.flatnonzero(keep), best[keep]].mean())
+    return text, score
+
+
+def fix_plate_positions(text):
+    """
+    Standard AA1234BB plates have letters at both ends and digits in the middle, so
+    look-alike characters in the wrong place can be swapped back.
+    """
+    if len(text) != 8:
+        return text
+    fixed = [dict_int_to_char.get(char, char) if i in (0, 1, 6, 7) else dict_char_to_int.get(char, char)
+             for i, char in enumerate(text)]
+    return ''.join(fixed)
+
+
+class CrnnOcrBackend:
+    """
+    Small CRNN/CTC plate recognizer exported to ONNX and run with onnxruntime on CPU.
+
+    Model contract: input (N, 1, height, width) float32 grayscale lines scaled to [0, 1],
+    output (N, T, 1 + len(alphabet)) per-step class scores with the CTC blank at index 0.
+    The text lines of all crops (two per square plate) are read in one session run.
+    The alphabet comes from settings.ocr_crnn_alphabet: Ukrainian plates use the Latin
+    look-alikes of their Cyrillic letters.
+    """
+    name = 'crnn'
+
+    def __init__(self, onnx_path: str, alphabet: str, height: int = 32, width: int = 128,
+                 threads: int = 0):
+        self.onnx_path = onnx_path
+        self.alphabet = alphabet
+        self.height = height
+        self.width = width
+        self.threads = threads
+        self._lock = threading.Lock()
+        self.session = None
+        self.load_seconds = None
+
+    def _load(self):
+        with self._lock:
+            if self.session is not None:
+                return
+            import onnxruntime as ort
+
+            start = time.perf_counter()
+            options = ort.SessionOptions()
+            if self.threads > 0:
+                options.intra_op_num_threads = self.threads
+            session = ort.InferenceSession(self.onnx_path, options, providers=['CPUExecutionProvider'])
+            model_input = session.get_inputs()[0]
+            self.input_name = model_input.name
+            self.dynamic_batch = not isinstance(model_input.shape[0], int)
+            self.session = session
+            self.load_seconds = time.perf_counter() - start
+
+    def _prepare_line(self, line):
+        scale = self.height / line.shape[0]
+        width = min(self.width, max(int(line.shape[1] * scale), 1))
+        resized = cv2.resize(line, (width, self.height), interpolation=cv2.INTER_AREA)
+        # Pad on the right with the line's background so short lines keep their proportions
+        canvas = np.full((self.height, self.width), np.median(resized), dtype=np.float32)
+        canvas[:, :width] = resized
+        return canvas / 255.
+
+    def _run(self, inputs):
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: inputs})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: line[None]})[0] for line in inputs])
+        # Models exported without a softmax output logits
+        if not np.allclose(outputs.sum(axis=2), 1., atol=1e-3):
+            outputs = np.exp(outputs - outputs.max(axis=2, keepdims=True))
+            outputs /= outputs.sum(axis=2, keepdims=True)
+        return outputs
+
+    def read_batch(self, crops):
+        if self.session is None:
+            self._load()
+        start = time.perf_counter()
+        lines, owners = [], []
+        for index, crop in enumerate(crops):
+            height, width = crop.shape[:2]
+            for x_min, x_max, y_min, y_max in plate_line_boxes(width, height, settings.ocr_flag_margin):
+                line = crop[y_min:y_max, x_min:x_max]
+                if line.size:
+                    lines.append(self._prepare_line(line))
+                    owners.append(index)
+
+        texts = [[] for _ in crops]
+        scores = [[] for _ in crops]
+        if lines:
+            outputs = self._run(np.stack(lines)[:, None])
+            for index, probabilities in zip(owners, outputs):
+                text, score = ctc_greedy_decode(probabilities, self.alphabet)
+                texts[index].append(text)
+                scores[index].append(score)
+
+        reads = []
+        for crop_texts, crop_scores in zip(texts, scores):
+            text = fix_plate_positions(''.join(crop_texts))
+            reads.append((text, min(crop_scores)) if text else (None, None))
+        return reads, {'crops': len(crops), 'lines': len(lines), 'seconds': time.perf_counter() - start}
+
+    def warm_up(self):
+        self.read_batch([np.full((32, 128), 255, dtype=np.uint8)])
+
+    def metrics(self) -> dict:
+        return {
+            'backend': self.name,
+            'loaded': self.session is not None,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
+
+
+def load_ocr_backend(backend: str | None = None):
+    """
+    Build the OCR backend selected by OCR_BACKEND. easyocr is the fallback when the
+    CRNN model file is missing.
+    """
+    backend = backend or settings.ocr_backend
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {backend}, expected one of {OCR_BACKENDS}")
+    if backend == 'crnn':
+        if os.path.exists(settings.ocr_crnn_model):
+            return CrnnOcrBackend(settings.ocr_crnn_model, settings.ocr_crnn_alphabet, settings.ocr_crnn_height,
+                                  settings.ocr_crnn_width, settings.onnx_threads)
+        print(f"CRNN OCR model {settings.ocr_crnn_model} not found, falling back to easyocr")
+    return EasyOcrBackend()
+
+
+ocr_backend = load_ocr_backend()
@@ -0,0 +1,143 @@
+"""
+Latency and accuracy harness of the OCR backends.
+
+Reads a labelled set of plate crops, either a directory of images named after their
+plate text (`AA1234BB.jpg`, `AA1234BB_2.jpg`) or a CSV file of `path,text` rows, runs
+every backend over it in batches and prints per-crop latency percentiles, throughput,
+exact match and character accuracy as JSON. easyocr runs once per OCR mode, and the
+recognize mode reads are checked against the readtext ones.
+
+    python -m src.services.cv_service.ocr_bench data/plates --backends easyocr crnn --output ocr.json
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from src.conf.config import settings
+from src.services.cv_service.ocr_backends import OCR_BACKENDS, load_ocr_backend
+from src.services.cv_service.preprocess import preprocess_plate_crop
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_dataset(source):
+    """
+    (path, text) pairs of a directory of crops named by their plate or of a CSV file.
+    """
+    if os.path.isdir(source):
+        return [(os.path.join(source, name), os.path.splitext(name)[0].split('_')[0].upper())
+                for name in sorted(os.listdir(source)) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    base = os.path.dirname(source)
+    with open(source, newline='') as f:
+        return [(os.path.join(base, row[0]), row[1].strip().upper())
+                for row in csv.reader(f) if len(row) >= 2 and row[0] != 'path']
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def run_backend(backend, crops, labels, batch_size=8, warmup=True):
+    """
+    Returns the metrics of `backend` over the crops and the texts it read.
+    """
+    if warmup:
+        backend.warm_up()
+    latencies, reads = [], []
+    for start in range(0, len(crops), batch_size):
+        batch = crops[start:start + batch_size]
+        began = time.perf_counter()
+        batch_reads, _ = backend.read_batch(batch)
+        # Per-crop latency of the batch, the way the pipeline pays for it
+        latencies.extend([(time.perf_counter() - began) / len(batch)] * len(batch))
+        reads.extend(batch_reads)
+
+    latencies = np.array(latencies) * 1000
+    texts = [text or '' for text, _ in reads]
+    errors = sum(edit_distance(text, label) for text, label in zip(texts, labels))
+    characters = sum(len(label) for label in labels)
+    total = latencies.sum() / 1000
+    return texts, {
+        'crops': len(crops),
+        'exact_match': round(sum(text == label for text, label in zip(texts, labels)) / len(labels), 4),
+        'char_accuracy': round(max(0., 1 - errors / characters), 4) if characters else None,
+        'no_read': sum(1 for text in texts if not text),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'crops_per_second': round(len(crops) / total, 1) if total else None,
+    }
+
+
+def agreement(texts, reference, paths):
+    """
+    Share of the crops read the same as in `reference`, and the crops that differ.
+    """
+    differences = [{'path': path, 'read': text, 'reference': ref}
+                   for path, text, ref in zip(paths, texts, reference) if text != ref]
+    return round(1 - len(differences) / len(reference), 4), differences
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='OCR backend latency and accuracy harness')
+    parser.add_argument('source', help='Directory of plate crops named by plate text, or a path,text CSV file.')
+    parser.add_argument('--backends', nargs='+', default=list(OCR_BACKENDS), choices=OCR_BACKENDS)
+    parser.add_argument('--ocr-modes', nargs='+', default=['readtext', 'recognize'],
+                        choices=['readtext', 'recognize'], help='OCR modes easyocr runs in.')
+    parser.add_argument('--batch-size', type=int, default=8, help='Crops per read_batch call.')
+    parser.add_argument('--raw', action='store_true',
+                        help='Feed the grayscale crops as they are instead of preprocessing them first.')
+    parser.add_argument('--output', help='Write the JSON report to this file as well.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    dataset = load_dataset(args.source)
+    paths, crops, labels = [], [], []
+    for path, text in dataset:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping unreadable image {path}")
+            continue
+        paths.append(path)
+        crops.append(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if args.raw else preprocess_plate_crop(image))
+        labels.append(text)
+    if not crops:
+        raise SystemExit(f"No labelled plate crops found in {args.source}")
+
+    results = {}
+    for name in args.backends:
+        backend = load_ocr_backend(name)
+        if backend.name != name:
+            print(f"Skipping {name}, its model is not available")
+            continue
+        if name != 'easyocr':
+            _, results[name] = run_backend(backend, crops, labels, args.batch_size)
+            continue
+
+        texts_by_mode = {}
+        for mode in args.ocr_modes:
+            settings.ocr_mode = mode
+            texts_by_mode[mode], results[f'{name}/{mode}'] = run_backend(backend, crops, labels, args.batch_size)
+        if 'readtext' in texts_by_mode and 'recognize' in texts_by_mode:
+            share, differences = agreement(texts_by_mode['recognize'], texts_by_mode['readtext'], paths)
+            results[f'{name}/recognize'].update(agreement_with_readtext=share, differences=differences)
+
+    report = {'source': args.source, 'preprocessed': not args.raw, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
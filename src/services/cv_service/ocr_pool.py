@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.conf.config import settings
+
+
+OCR_LANGUAGES = ['en', 'uk']
+
+
+class ReaderPool:
+    """
+    Fixed-size pool of easyocr readers shared by every request in a worker process.
+
+    Readers are expensive to build (CRAFT and recognizer weights are loaded from disk),
+    so they are created once, up to `size`, and handed out one caller at a time.
+    """
+
+    def __init__(self, size: int = 1, languages: list[str] = OCR_LANGUAGES, gpu: bool = False):
+        if size < 1:
+            raise ValueError("OCR reader pool size must be at least 1.")
+        self.size = size
+        self.languages = languages
+        self.gpu = gpu
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._borrows = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._build_time = 0.0
+
+    def _create_reader(self):
+        import easyocr
+
+        start = time.perf_counter()
+        reader = easyocr.Reader(self.languages, gpu=self.gpu)
+        with self._lock:
+            self._build_time += time.perf_counter() - start
+        return reader
+
+    def _acquire(self, timeout: float | None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        # Reserve a slot under the lock, but build the reader outside of it:
+        # loading the models takes seconds and would block returning readers and metrics()
+        with self._lock:
+            reserved = self._created < self.size
+            if reserved:
+                self._created += 1
+            else:
+                self._waits += 1
+
+        if reserved:
+            try:
+                return self._create_reader()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No OCR reader became available within {timeout} seconds.")
+
+    @contextmanager
+    def borrow(self, timeout: float | None = None):
+        """
+        Lend a reader to the caller for the duration of the `with` block.
+        """
+        start = time.perf_counter()
+        reader = self._acquire(timeout)
+        with self._lock:
+            self._wait_time += time.perf_counter() - start
+            self._borrows += 1
+            self._in_use += 1
+        try:
+            yield reader
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(reader)
+
+    def warm_up(self):
+        """
+        Build every reader in the pool and run one recognition on each,
+        so the first real request does not pay for model loading.
+        """
+        readers = [self._acquire(None) for _ in range(self.size)]
+        blank = np.full((32, 128), 255, dtype=np.uint8)
+        try:
+            for reader in readers:
+                reader.readtext(blank)
+        finally:
+            for reader in readers:
+                self._idle.put(reader)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'borrows': self._borrows,
+                'waits': self._waits,
+                'total_wait_seconds': round(self._wait_time, 4),
+                'avg_wait_seconds': round(self._wait_time / self._borrows, 4) if self._borrows else 0.0,
+                'build_seconds': round(self._build_time, 4),
+            }
+
+
+reader_pool = ReaderPool(size=settings.ocr_pool_size, gpu=settings.ocr_gpu)
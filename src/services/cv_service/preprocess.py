@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from src.conf.config import settings
+
+
+# Kernel of Immerkaer's fast noise estimate: it cancels smooth image structure and keeps the noise
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
+def measure_quality(gray) -> dict:
+    """
+    Cheap quality measures of a grayscale crop: sharpness (variance of the Laplacian),
+    noise (estimated standard deviation of the pixel noise) and contrast (standard
+    deviation of the intensities).
+    """
+    height, width = gray.shape[:2]
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+    if height > 2 and width > 2:
+        residual = cv2.filter2D(gray.astype(np.float32), -1, NOISE_KERNEL)[1:-1, 1:-1]
+        # The residual of pure noise has 6x its standard deviation, the median keeps plate edges out
+        noise = float(np.median(np.abs(residual)) / 0.6745 / 6)
+    else:
+        noise = 0.
+    contrast = float(gray.std())
+    return {'sharpness': sharpness, 'noise': noise, 'contrast': contrast}
+
+
+class StageStats:
+    """
+    Per-stage call counts and average timings of a pipeline, e.g. how often each plate
+    crop preprocessing stage ran and how long it took.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def record(self, timings: dict):
+        with self._lock:
+            self.runs += 1
+            for stage, seconds in timings.items():
+                self.calls[stage] += 1
+                self.seconds[stage] += seconds
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'stages': {stage: {'calls': self.calls[stage],
+                                   'avg_ms': round(self.seconds[stage] / self.calls[stage] * 1000, 3)}
+                           for stage in self.calls},
+            }
+
+
+preprocess_stats = StageStats()
+
+
+def _timed(timings, stage, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def plan_stages(quality: dict) -> dict:
+    """
+    Choose the enhancement and denoising stages for a crop of the given quality.
+    Clean crops skip the non-local means denoiser, moderately noisy ones get a cheaper
+    variant, low-contrast ones get histogram equalization on top of CLAHE. Blurry crops
+    never get the full denoiser, it would wash out what is left of the characters.
+    """
+    if quality['noise'] < settings.preprocess_noise_low:
+        denoise = None
+    elif quality['noise'] < settings.preprocess_noise_high or quality['sharpness'] < settings.preprocess_sharpness_min:
+        denoise = 'light'
+    else:
+        denoise = 'full'
+    return {'equalize': quality['contrast'] < settings.preprocess_contrast_min, 'denoise': denoise}
+
+
+def preprocess_plate_crop(license_plate_crop, timings: dict | None = None):
+    """
+    Grayscale, CLAHE, histogram equalization and non-local means denoising of a plate crop.
+
+    In `adaptive` mode (PREPROCESS_MODE) the crop quality is measured first and the
+    equalization and denoising stages are skipped or downgraded when the crop does not
+    need them; `full` mode always runs every stage. The time of every stage that ran is
+    written into `timings` and added to `preprocess_stats`.
+    """
+    timings = {} if timings is None else timings
+    license_plate_crop_ = _timed(timings, 'gray', cv2.cvtColor, license_plate_crop, cv2.COLOR_BGR2GRAY)
+
+    if settings.preprocess_mode == 'adaptive':
+        quality = _timed(timings, 'measure', measure_quality, license_plate_crop_)
+        stages = plan_stages(quality)
+    else:
+        stages = {'equalize': True, 'denoise': 'full'}
+
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    # Apply CLAHE to the grayscale image
+    enhanced_image = _timed(timings, 'clahe', clahe.apply, license_plate_crop_)
+    if stages['equalize']:
+        enhanced_image = _timed(timings, 'equalize', cv2.equalizeHist, enhanced_image)
+
+    if stages['denoise'] == 'full':
+        enhanced_image = _timed(timings, 'denoise', cv2.fastNlMeansDenoising, enhanced_image, None, 30, 7, 21)
+    elif stages['denoise'] == 'light':
+        enhanced_image = _timed(timings, 'denoise_light', cv2.fastNlMeansDenoising, enhanced_image, None, 15, 5, 11)
+
+    preprocess_stats.record(timings)
+    return enhanced_image
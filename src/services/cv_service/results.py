@@ -0,0 +1,73 @@
+from dataclasses import dataclass, field, astuple, fields
+
+
+@dataclass(slots=True)
+class PlateRead:
+    frame_nmr: int
+    car_id: float
+    car_bbox: list
+    plate_bbox: list
+    bbox_score: float
+    text: str
+    text_score: float
+
+
+@dataclass(slots=True)
+class PlateEvent:
+    """
+    One vehicle track of a video: its fused plate read and the frames it was seen in.
+    """
+    track_id: int
+    read: PlateRead
+    first_frame: int
+    last_frame: int
+    reads: int
+
+
+@dataclass(slots=True)
+class RecognitionResult:
+    """
+    Plate reads of one image or video, in the order they were recognized,
+    and the counters of the run (frames processed, skipped, ...).
+    """
+    reads: list[PlateRead] = field(default_factory=list)
+    stats: dict = field(default_factory=dict)
+
+    def add(self, read: PlateRead):
+        self.reads.append(read)
+
+    def __len__(self):
+        return len(self.reads)
+
+    def __iter__(self):
+        return iter(self.reads)
+
+    def frame(self, frame_nmr: int) -> list[PlateRead]:
+        return [read for read in self.reads if read.frame_nmr == frame_nmr]
+
+    def first(self) -> PlateRead:
+        if not self.reads:
+            raise ValueError("No license plate recognized.")
+        return self.reads[0]
+
+    def plate_text(self) -> str:
+        return self.first().text
+
+
+def write_parquet(result: RecognitionResult, output_path):
+    import pandas as pd
+
+    columns = [f.name for f in fields(PlateRead)]
+    pd.DataFrame([astuple(read) for read in result], columns=columns).to_parquet(output_path)
+
+
+def export_results(result: RecognitionResult, output_path):
+    """
+    Optional sink: save the reads as CSV (the legacy reads.csv format) or Parquet.
+    """
+    from src.services.cv_service.util import write_csv
+
+    if str(output_path).endswith('.parquet'):
+        write_parquet(result, output_path)
+    else:
+        write_csv(result, output_path)
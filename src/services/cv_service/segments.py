@@ -0,0 +1,153 @@
+"""
+Segment-parallel processing of long recorded videos.
+
+The video is split into frame ranges that are tracked and OCRed in a process pool.
+Every segment after the first starts `overlap` frames early, and tracks that cross
+a segment boundary are stitched back into one event by their plate text.
+
+    python -m src.services.cv_service.segments recording.mp4 --workers 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+from difflib import SequenceMatcher
+
+import cv2
+
+from src.conf.config import settings
+from src.services.cv_service.executor import init_worker
+from src.services.cv_service.results import PlateEvent
+
+
+def split_segments(frame_count: int, segments: int, overlap: int) -> list[tuple[int, int, int]]:
+    """
+    Split [0, frame_count) into `segments` ranges.
+    Returns (start, boundary, end) triples: frames are processed from `start`, which is
+    `overlap` frames before the segment's own first frame `boundary`, up to `end`.
+    """
+    segments = max(1, min(segments, frame_count))
+    length = -(-frame_count // segments)
+    ranges = []
+    for boundary in range(0, frame_count, length):
+        ranges.append((max(0, boundary - overlap), boundary, min(frame_count, boundary + length)))
+    return ranges
+
+
+def _process_segment(source, vehicles, start, boundary, end):
+    from src.services.cv_service.lic_rec import run_video_pipeline
+
+    started = time.perf_counter()
+    # The overlap only warms up the tracker, its frames are counted by the previous segment
+    events, stats = run_video_pipeline(source, vehicles, start_frame=start, end_frame=end, count_from=boundary)
+    stats['seconds'] = time.perf_counter() - started
+    return events, stats
+
+
+def same_plate(a: PlateEvent, b: PlateEvent, min_similarity: float) -> bool:
+    return SequenceMatcher(None, a.read.text, b.read.text).ratio() >= min_similarity
+
+
+def merge_events(a: PlateEvent, b: PlateEvent) -> PlateEvent:
+    best = a if a.read.text_score >= b.read.text_score else b
+    return PlateEvent(best.track_id, best.read, min(a.first_frame, b.first_frame),
+                      max(a.last_frame, b.last_frame), a.reads + b.reads)
+
+
+def offset_track_ids(segment_events: list[list[PlateEvent]]) -> list[list[PlateEvent]]:
+    """
+    Every segment's tracker numbers its tracks from 1, so shift the IDs of each segment
+    past the highest ID of the segments before it.
+    """
+    offset_events = []
+    offset = 0
+    for events in segment_events:
+        shifted = [replace(event, track_id=event.track_id + offset,
+                           read=replace(event.read, car_id=event.read.car_id + offset)) for event in events]
+        offset = max([offset] + [event.track_id for event in shifted])
+        offset_events.append(shifted)
+    return offset_events
+
+
+def stitch_segments(segment_events: list[list[PlateEvent]], ranges, overlap: int,
+                    min_similarity: float = 0.75) -> list[PlateEvent]:
+    """
+    Merge the events of consecutive segments into one timeline.
+
+    An event that reaches into the overlap window at the end of a segment and an event of
+    the next segment that starts before the boundary are the same vehicle when their
+    plate texts are similar enough. Track IDs stay unique across segments.
+    """
+    segment_events = offset_track_ids(segment_events)
+    timeline = list(segment_events[0]) if segment_events else []
+    for events, (start, boundary, _) in zip(segment_events[1:], ranges[1:]):
+        open_events = [event for event in timeline if event.last_frame >= boundary - overlap]
+        for event in events:
+            match = None
+            if event.first_frame < boundary:
+                match = next((candidate for candidate in open_events if same_plate(candidate, event, min_similarity)),
+                             None)
+            if match is None:
+                timeline.append(event)
+                continue
+            merged = merge_events(match, event)
+            timeline[timeline.index(match)] = merged
+            open_events[open_events.index(match)] = merged
+    return sorted(timeline, key=lambda event: event.first_frame)
+
+
+def process_video_segments(source, vehicles, workers: int | None = None, overlap: int | None = None):
+    """
+    Process a recorded video in parallel segments and return the merged plate timeline
+    together with the counters of the run.
+    """
+    workers = workers or settings.video_segment_workers or os.cpu_count()
+    overlap = settings.video_segment_overlap if overlap is None else overlap
+
+    capture = cv2.VideoCapture(source)
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    if frame_count <= 0:
+        raise ValueError(f"Could not read the frame count of {source}.")
+
+    ranges = split_segments(frame_count, workers, overlap)
+    # Split the cores between the workers instead of letting every worker use all of them
+    threads = max(1, (os.cpu_count() or 1) // len(ranges))
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(threads, settings.ocr_warm_up)) as pool:
+        futures = [pool.submit(_process_segment, source, vehicles, start, boundary, end)
+                   for start, boundary, end in ranges]
+        outputs = [future.result() for future in futures]
+    seconds = time.perf_counter() - started
+
+    timeline = stitch_segments([events for events, _ in outputs], ranges, overlap)
+    stats = {
+        'frames': frame_count,
+        'segments': len(ranges),
+        'seconds': round(seconds, 3),
+        'frames_per_second': round(frame_count / seconds, 2) if seconds else None,
+        'frames_processed': sum(segment_stats['frames_processed'] for _, segment_stats in outputs),
+        'plates_ocred': sum(segment_stats['plates_ocred'] for _, segment_stats in outputs),
+        'segment_seconds': [round(segment_stats['seconds'], 3) for _, segment_stats in outputs],
+    }
+    return timeline, stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Segment-parallel plate recognition of a recorded video')
+    parser.add_argument('source', help='Path to the video file.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of segments / worker processes.')
+    parser.add_argument('--overlap', type=int, default=None, help='Overlap between segments, in frames.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    from src.services.cv_service.lic_rec import vehicles
+
+    args = parse_args()
+    timeline, stats = process_video_segments(args.source, vehicles, args.workers, args.overlap)
+    print(json.dumps({'stats': stats, 'timeline': [asdict(event) for event in timeline]}, indent=2, default=str))
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from src.conf.config import settings
+
+
+VEHICLE_WEIGHTS = 'yolov8n.pt'
+LICENSE_PLATE_WEIGHTS = 'license_plate_detector.pt'
+
+
+class CVService:
+    """
+    Owner of the detection models.
+
+    Nothing heavy (torch, ultralytics, onnxruntime) is imported until the models are
+    first used or `warm_up` is called, so importing the API, Alembic or auth-only
+    processes does not pay for the CV stack.
+    """
+
+    def __init__(self, vehicle_weights: str = VEHICLE_WEIGHTS, license_plate_weights: str = LICENSE_PLATE_WEIGHTS):
+        self.vehicle_weights = vehicle_weights
+        self.license_plate_weights = license_plate_weights
+        self._lock = threading.Lock()
+        self._coco_model = None
+        self._license_plate_detector = None
+        self.load_seconds = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._license_plate_detector is not None
+
+    def _load(self):
+        with self._lock:
+            if self.loaded:
+                return
+            from src.services.cv_service.detectors import load_detector
+
+            start = time.perf_counter()
+            self._coco_model = load_detector(self.vehicle_weights)  # for cars detection
+            self._license_plate_detector = load_detector(self.license_plate_weights)  # for license plates detection
+            self.load_seconds = time.perf_counter() - start
+            print(f"CV models loaded in {self.load_seconds:.2f}s")
+
+    @property
+    def coco_model(self):
+        if not self.loaded:
+            self._load()
+        return self._coco_model
+
+    @property
+    def license_plate_detector(self):
+        if not self.loaded:
+            self._load()
+        return self._license_plate_detector
+
+    def warm_up(self, ocr: bool = True):
+        """
+        Load the detectors and, optionally, the OCR backend ahead of the first request.
+        """
+        self._load()
+        if ocr:
+            from src.services.cv_service.ocr_backends import ocr_backend
+
+            ocr_backend.warm_up()
+
+    def metrics(self) -> dict:
+        return {
+            'loaded': self.loaded,
+            'backend': settings.detector_backend,
+            'load_seconds': round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
+
+
+cv_service = CVService()
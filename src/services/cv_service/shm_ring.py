@@ -0,0 +1,109 @@
+"""
+Shared-memory frame handoff between decoder and inference processes.
+
+Frames are written once into a ring of `multiprocessing.shared_memory` slots and read
+by the inference side as NumPy views of the same memory, so only a small metadata
+tuple goes through a queue instead of a pickled full-resolution frame. The live camera
+ingest (ingest.py) decodes every camera in its own process into a FrameRing.
+"""
+import multiprocessing
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+class FrameRing:
+    """
+    Ring of fixed-size frame slots in one shared memory block.
+
+    Free slot indices wait in `free`, filled slots are announced on `ready` as
+    `(slot, stream_id, frame_nmr, decoded_at, height, width)` tuples. A producer blocks
+    (or, with a timeout, gives up) while every slot is in use, which bounds memory.
+    The ring is created in the parent and handed to child processes as an argument;
+    children attach to the existing block by name.
+    """
+
+    def __init__(self, slots: int, frame_shape: tuple[int, int, int], ctx=None):
+        ctx = ctx or multiprocessing.get_context('spawn')
+        self.slots = slots
+        self.frame_shape = tuple(frame_shape)
+        self.slot_size = int(np.prod(self.frame_shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_size)
+        self._owner = True
+        self.free = ctx.Queue()
+        self.ready = ctx.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+
+    def __getstate__(self):
+        return {'slots': self.slots, 'frame_shape': self.frame_shape, 'slot_size': self.slot_size,
+                'name': self._shm.name, 'free': self.free, 'ready': self.ready}
+
+    def __setstate__(self, state):
+        self.slots = state['slots']
+        self.frame_shape = state['frame_shape']
+        self.slot_size = state['slot_size']
+        self.free = state['free']
+        self.ready = state['ready']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._owner = False
+
+    def _view(self, slot: int, height: int, width: int) -> np.ndarray:
+        channels = self.frame_shape[2]
+        return np.ndarray((height, width, channels), dtype=np.uint8, buffer=self._shm.buf,
+                          offset=slot * self.slot_size)
+
+    def put(self, stream_id, frame_nmr: int, frame: np.ndarray, timeout: float | None = None):
+        """
+        Copy `frame` into a free slot and announce it. Blocks while the ring is full,
+        raises queue.Empty when no slot became free within `timeout`.
+        """
+        height, width = frame.shape[:2]
+        if height * width * self.frame_shape[2] > self.slot_size:
+            raise ValueError(f"Frame of {width}x{height} does not fit the ring slots {self.frame_shape}.")
+        slot = self.free.get(timeout=timeout)
+        self._view(slot, height, width)[:] = frame
+        self.ready.put((slot, stream_id, frame_nmr, time.time(), height, width))
+
+    def take(self, timeout: float | None = None):
+        """
+        Wait for the next frame and return `(slot, stream_id, frame_nmr, decoded_at, frame)`,
+        raises queue.Empty after `timeout`. `frame` is a view of the slot: it stays valid
+        until the slot is handed back with `release`.
+        """
+        slot, stream_id, frame_nmr, decoded_at, height, width = self.ready.get(timeout=timeout)
+        return slot, stream_id, frame_nmr, decoded_at, self._view(slot, height, width)
+
+    def release(self, slot: int):
+        self.free.put(slot)
+
+    @contextmanager
+    def get(self, timeout: float | None = None):
+        """
+        `take` for the duration of a `with` block: yields `(stream_id, frame_nmr, frame)`
+        and gives the slot back to the ring on exit, so the frame must not be kept.
+        """
+        slot, stream_id, frame_nmr, _, frame = self.take(timeout)
+        try:
+            yield stream_id, frame_nmr, frame
+        finally:
+            self.release(slot)
+
+    def close(self):
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def fit_frame(frame: np.ndarray, frame_shape: tuple[int, int, int]) -> np.ndarray:
+    """
+    Downscale `frame`, keeping its aspect ratio, when it is larger than the ring slots.
+    """
+    height, width = frame.shape[:2]
+    scale = min(frame_shape[0] / height, frame_shape[1] / width)
+    if scale >= 1:
+        return frame
+    return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,170 @@
+"""
+    Headless latency benchmark of SORT tracker implementations.
+
+    Runs every tracker over synthetic detection sequences and/or MOT det.txt files and
+    prints per-frame latency percentiles and throughput as JSON. Exits with status 1 when
+    a result exceeds --max-p99-ms or regresses more than --max-regression against a
+    --baseline JSON written by an earlier run.
+
+    python -m src.services.cv_service.sort.benchmark --objects 20 200 --output bench.json
+    python -m src.services.cv_service.sort.benchmark --mot data/train/*/det/det.txt --baseline bench.json
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from src.services.cv_service.sort.sort import FilterpySort, KalmanBoxTracker, Sort
+
+
+TRACKERS = {'sort': Sort, 'filterpy': FilterpySort}
+
+
+def synthetic_sequence(frames=500, objects=50, occlusion=0.1, jitter=2., width=1920, height=1080, seed=0):
+  """
+  Detections of `objects` boxes moving at constant velocity, bouncing off the frame edges.
+  Every detection is missed with probability `occlusion` and its corners are shifted
+    by Gaussian noise of `jitter` pixels.
+  """
+  rng = np.random.default_rng(seed)
+  size = rng.uniform(30, 200, (objects, 2))
+  pos = rng.uniform(0, 1, (objects, 2)) * ([width, height] - size)
+  vel = rng.normal(0, 4, (objects, 2))
+  sequence = []
+  for _ in range(frames):
+    pos += vel
+    bounced = (pos < 0) | (pos + size > [width, height])
+    vel[bounced] *= -1
+    pos = np.clip(pos, 0, [width, height] - size)
+    visible = rng.random(objects) >= occlusion
+    dets = np.concatenate([pos, pos + size, rng.uniform(0.5, 1., (objects, 1))], axis=1)[visible]
+    dets[:, :4] += rng.normal(0, jitter, (len(dets), 4))
+    sequence.append(dets[rng.permutation(len(dets))])
+  return sequence
+
+
+def load_mot(path):
+  """
+  Per-frame [x1,y1,x2,y2,score] detections of a MOT det.txt file.
+  """
+  seq_dets = np.loadtxt(path, delimiter=',', ndmin=2)
+  sequence = []
+  for frame in range(1, int(seq_dets[:, 0].max()) + 1):
+    dets = seq_dets[seq_dets[:, 0] == frame, 2:7]
+    dets[:, 2:4] += dets[:, 0:2] #convert to [x1,y1,w,h] to [x1,y1,x2,y2]
+    sequence.append(dets)
+  return sequence
+
+
+def load_tracker(spec):
+  """
+  A tracker name of TRACKERS or a `module:Class` path to an alternative implementation
+    with the Sort constructor and update() contract.
+  """
+  if spec in TRACKERS:
+    return TRACKERS[spec]
+  module, _, name = spec.partition(':')
+  return getattr(importlib.import_module(module), name)
+
+
+def run_tracker(tracker_cls, sequence, max_age=1, min_hits=3, iou_threshold=0.3, warmup=10):
+  KalmanBoxTracker.count = 0
+  tracker = tracker_cls(max_age=max_age, min_hits=min_hits, iou_threshold=iou_threshold)
+  latencies = []
+  ids = set()
+  for dets in sequence:
+    start = time.perf_counter()
+    tracks = tracker.update(dets)
+    latencies.append(time.perf_counter() - start)
+    ids.update(tracks[:, 4].astype(int).tolist())
+
+  latencies = np.array(latencies[warmup:] if len(latencies) > warmup else latencies) * 1000
+  total = latencies.sum() / 1000
+  return {
+    'frames': len(latencies),
+    'detections_per_frame': round(float(np.mean([len(dets) for dets in sequence])), 1),
+    'track_ids': len(ids),
+    'mean_ms': round(float(latencies.mean()), 4),
+    'p50_ms': round(float(np.percentile(latencies, 50)), 4),
+    'p90_ms': round(float(np.percentile(latencies, 90)), 4),
+    'p99_ms': round(float(np.percentile(latencies, 99)), 4),
+    'max_ms': round(float(latencies.max()), 4),
+    'fps': round(len(latencies) / total, 1) if total else None,
+  }
+
+
+def check_regressions(results, baseline, max_regression, max_p99_ms):
+  """
+  Returns the failures of `results`: p99 above the absolute limit, or p50 / p99 more than
+    `max_regression` (a fraction) above the same tracker and sequence in `baseline`.
+  """
+  failures = []
+  for key, result in results.items():
+    if max_p99_ms is not None and result['p99_ms'] > max_p99_ms:
+      failures.append(f"{key}: p99 {result['p99_ms']} ms > {max_p99_ms} ms")
+    previous = baseline.get(key)
+    if previous is None or max_regression is None:
+      continue
+    for metric in ('p50_ms', 'p99_ms'):
+      limit = previous[metric] * (1 + max_regression)
+      if result[metric] > limit:
+        failures.append(f"{key}: {metric} {result[metric]} ms > {round(limit, 4)} ms (baseline {previous[metric]} ms)")
+  return failures
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='SORT tracker benchmark')
+  parser.add_argument('--trackers', nargs='+', default=['sort', 'filterpy'],
+                      help='Tracker names (%s) or module:Class paths.' % ', '.join(TRACKERS))
+  parser.add_argument('--objects', nargs='*', type=int, default=[20, 100],
+                      help='Object counts of the synthetic sequences.')
+  parser.add_argument('--frames', type=int, default=500, help='Frames per synthetic sequence.')
+  parser.add_argument('--occlusion', type=float, default=0.1, help='Probability of a missed detection.')
+  parser.add_argument('--jitter', type=float, default=2., help='Box corner noise in pixels.')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--mot', nargs='*', default=[], help='MOT det.txt files.')
+  parser.add_argument('--max_age', type=int, default=1)
+  parser.add_argument('--min_hits', type=int, default=3)
+  parser.add_argument('--iou_threshold', type=float, default=0.3)
+  parser.add_argument('--output', help='Write the JSON report to this file as well.')
+  parser.add_argument('--baseline', help='JSON report of an earlier run to compare against.')
+  parser.add_argument('--max-regression', type=float, default=0.2,
+                      help='Allowed slowdown of p50 / p99 against the baseline, as a fraction.')
+  parser.add_argument('--max-p99-ms', type=float, default=None, help='Absolute p99 latency limit.')
+  return parser.parse_args()
+
+
+if __name__ == '__main__':
+  args = parse_args()
+  sequences = {}
+  for objects in args.objects:
+    sequences['synthetic-%d' % objects] = synthetic_sequence(args.frames, objects, args.occlusion, args.jitter,
+                                                             seed=args.seed)
+  for path in args.mot:
+    sequences[os.path.normpath(path)] = load_mot(path)
+
+  results = {}
+  for spec in args.trackers:
+    tracker_cls = load_tracker(spec)
+    for name, sequence in sequences.items():
+      results['%s/%s' % (spec, name)] = run_tracker(tracker_cls, sequence, args.max_age, args.min_hits,
+                                                    args.iou_threshold)
+
+  failures = []
+  if args.baseline or args.max_p99_ms is not None:
+    baseline = {}
+    if args.baseline:
+      with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    failures = check_regressions(results, baseline, args.max_regression, args.max_p99_ms)
+
+  report = {'results': results, 'failures': failures}
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(report, f, indent=2)
+  print(json.dumps(report, indent=2))
+  sys.exit(1 if failures else 0)
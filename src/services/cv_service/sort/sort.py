@@ -19,19 +19,16 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
 import glob
 import time
 import argparse
-from filterpy.kalman import KalmanFilter
 
 np.random.seed(0)
 
+# Above this many detection-tracker pairs the IOU matrix is only computed for nearby pairs
+GRID_MIN_PAIRS = 10000
+
 
 def linear_assignment(cost_matrix):
   try:
@@ -63,6 +60,61 @@ def iou_batch(bb_test, bb_gt):
   return(o)  
 
 
+def candidate_pairs(bb_test, bb_gt):
+  """
+  Spatial grid prefilter: returns the (i, j) index arrays of the bb_test / bb_gt pairs that
+    can overlap, without comparing every pair.
+  The grid cells are as large as the largest box side, so the centres of two overlapping
+    boxes always lie in the same or in neighbouring cells.
+  """
+  boxes = np.concatenate([bb_test[:, :4], bb_gt[:, :4]])
+  cell = max(float(np.max(boxes[:, 2:] - boxes[:, :2])), 1e-6)
+  cells_test = np.floor((bb_test[:, :2] + bb_test[:, 2:4]) / 2. / cell).astype(np.int64)
+  cells_gt = np.floor((bb_gt[:, :2] + bb_gt[:, 2:4]) / 2. / cell).astype(np.int64)
+  low = np.minimum(cells_test.min(0), cells_gt.min(0)) - 1
+  cells_test -= low
+  cells_gt -= low
+  width = max(cells_test[:, 1].max(), cells_gt[:, 1].max()) + 2
+
+  # bb_gt sorted by cell key, each neighbouring cell of a bb_test box is one searchsorted range
+  keys_gt = cells_gt[:, 0] * width + cells_gt[:, 1]
+  order = np.argsort(keys_gt, kind='stable')
+  keys_gt = keys_gt[order]
+  rows, cols = [], []
+  for dx in (-1, 0, 1):
+    for dy in (-1, 0, 1):
+      keys = (cells_test[:, 0] + dx) * width + cells_test[:, 1] + dy
+      start = np.searchsorted(keys_gt, keys, 'left')
+      counts = np.searchsorted(keys_gt, keys, 'right') - start
+      offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+      rows.append(np.repeat(np.arange(len(bb_test)), counts))
+      cols.append(order[np.repeat(start, counts) + offsets])
+  return np.concatenate(rows), np.concatenate(cols)
+
+
+def iou_pairs(bb_test, bb_gt):
+  """
+  IOU of the row-wise pairs of two equally long arrays of [x1,y1,x2,y2] bboxes
+  """
+  xx1 = np.maximum(bb_test[:, 0], bb_gt[:, 0])
+  yy1 = np.maximum(bb_test[:, 1], bb_gt[:, 1])
+  xx2 = np.minimum(bb_test[:, 2], bb_gt[:, 2])
+  yy2 = np.minimum(bb_test[:, 3], bb_gt[:, 3])
+  wh = np.maximum(0., xx2 - xx1) * np.maximum(0., yy2 - yy1)
+  return wh / ((bb_test[:, 2] - bb_test[:, 0]) * (bb_test[:, 3] - bb_test[:, 1])
+    + (bb_gt[:, 2] - bb_gt[:, 0]) * (bb_gt[:, 3] - bb_gt[:, 1]) - wh)
+
+
+def iou_grid(bb_test, bb_gt):
+  """
+  iou_batch computed only for the pairs returned by candidate_pairs, the other entries are 0.
+  """
+  o = np.zeros((len(bb_test), len(bb_gt)))
+  i, j = candidate_pairs(bb_test, bb_gt)
+  o[i, j] = iou_pairs(bb_test[i], bb_gt[j])
+  return o
+
+
 def convert_bbox_to_z(bbox):
   """
   Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form
@@ -91,6 +143,26 @@ def convert_x_to_bbox(x,score=None):
     return np.array([x[0]-w/2.,x[1]-h/2.,x[0]+w/2.,x[1]+h/2.,score]).reshape((1,5))
 
 
+def convert_bboxes_to_z(bboxes):
+  """
+  Vectorized convert_bbox_to_z: takes an (n,4+) array of [x1,y1,x2,y2] boxes and returns
+    the (n,4) array of their [x,y,s,r] forms
+  """
+  w = bboxes[:, 2] - bboxes[:, 0]
+  h = bboxes[:, 3] - bboxes[:, 1]
+  return np.stack([bboxes[:, 0] + w/2., bboxes[:, 1] + h/2., w * h, w / h.astype(float)], axis=1)
+
+
+def convert_x_to_bboxes(x):
+  """
+  Vectorized convert_x_to_bbox: takes an (n,4+) array of [x,y,s,r] states and returns
+    the (n,4) array of their [x1,y1,x2,y2] boxes
+  """
+  w = np.sqrt(x[:, 2] * x[:, 3])
+  h = x[:, 2] / w
+  return np.stack([x[:, 0]-w/2., x[:, 1]-h/2., x[:, 0]+w/2., x[:, 1]+h/2.], axis=1)
+
+
 class KalmanBoxTracker(object):
   """
   This class represents the internal state of individual tracked objects observed as bbox.
@@ -100,6 +172,8 @@ class KalmanBoxTracker(object):
     """
     Initialises a tracker using initial bounding box.
     """
+    from filterpy.kalman import KalmanFilter
+
     #define constant velocity model
     self.kf = KalmanFilter(dim_x=7, dim_z=4) 
     self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
@@ -151,6 +225,131 @@ class KalmanBoxTracker(object):
     return convert_x_to_bbox(self.kf.x)
 
 
+class BatchedKalmanBoxTracker(object):
+  """
+  The Kalman filters of all tracked objects, with their states and covariances stacked
+    in (n,7) and (n,7,7) arrays, so that predict and update are a few batched matrix
+    products instead of one filterpy KalmanFilter call per object.
+  Uses the constant velocity model and noise parameters of KalmanBoxTracker and the
+    same filterpy equations, so both produce the same tracks.
+  Track IDs come from the global KalmanBoxTracker counter, or from a counter of this
+    tracker alone with own_ids.
+  """
+  F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]], dtype=float)
+  R = np.diag([1., 1., 10., 10.])
+  Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+  P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+  def __init__(self, own_ids=False):
+    self.count = 0 if own_ids else None
+    self.x = np.empty((0, 7))
+    self.P = np.empty((0, 7, 7))
+    self.ids = np.empty(0, dtype=int)
+    self.time_since_update = np.empty(0, dtype=int)
+    self.hits = np.empty(0, dtype=int)
+    self.hit_streak = np.empty(0, dtype=int)
+    self.age = np.empty(0, dtype=int)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def add(self, bboxes):
+    """
+    Starts a track for every bbox.
+    """
+    n = len(bboxes)
+    x = np.zeros((n, 7))
+    x[:, :4] = convert_bboxes_to_z(bboxes)
+    self.x = np.concatenate([self.x, x])
+    self.P = np.concatenate([self.P, np.broadcast_to(self.P0, (n, 7, 7))])
+    if self.count is None:
+      first_id = KalmanBoxTracker.count
+      KalmanBoxTracker.count += n
+    else:
+      first_id = self.count
+      self.count += n
+    self.ids = np.concatenate([self.ids, first_id + np.arange(n)])
+    zeros = np.zeros(n, dtype=int)
+    self.time_since_update = np.concatenate([self.time_since_update, zeros])
+    self.hits = np.concatenate([self.hits, zeros])
+    self.hit_streak = np.concatenate([self.hit_streak, zeros])
+    self.age = np.concatenate([self.age, zeros])
+
+  def keep(self, mask):
+    """
+    Drops the tracks where mask is False.
+    """
+    for name in ('x', 'P', 'ids', 'time_since_update', 'hits', 'hit_streak', 'age'):
+      setattr(self, name, getattr(self, name)[mask])
+
+  def predict(self):
+    """
+    Advances all state vectors and returns the (n,4) predicted bounding boxes.
+    """
+    return self.predict_many([self])[0]
+
+  @classmethod
+  def predict_many(cls, trackers):
+    """
+    Advances the state vectors of several trackers in one batch and returns the
+      predicted bounding boxes of each.
+    """
+    splits = np.cumsum([len(t) for t in trackers])[:-1]
+    x = np.concatenate([t.x for t in trackers])
+    P = np.concatenate([t.P for t in trackers])
+    x[(x[:, 6] + x[:, 2]) <= 0, 6] *= 0.0
+    x = x @ cls.F.T
+    P = cls.F @ P @ cls.F.T + cls.Q
+    for t, t_x, t_P in zip(trackers, np.split(x, splits), np.split(P, splits)):
+      t.x, t.P = t_x, t_P
+      t.age += 1
+      t.hit_streak[t.time_since_update > 0] = 0
+      t.time_since_update += 1
+    return np.split(convert_x_to_bboxes(x), splits)
+
+  def update(self, indices, bboxes):
+    """
+    Updates the state vectors of the tracks at `indices` with their observed bboxes.
+    """
+    self.update_many([(self, indices, bboxes)])
+
+  @classmethod
+  def update_many(cls, updates):
+    """
+    Runs the updates of several trackers, given as (tracker, indices, bboxes), in one batch.
+    """
+    updates = [(t, np.asarray(indices, dtype=int), bboxes) for t, indices, bboxes in updates if len(indices)]
+    if not updates:
+      return
+    x = np.concatenate([t.x[indices] for t, indices, _ in updates])
+    P = np.concatenate([t.P[indices] for t, indices, _ in updates])
+    z = np.concatenate([convert_bboxes_to_z(bboxes) for _, _, bboxes in updates])
+    y = z - x[:, :4]
+    PHT = P[:, :, :4]
+    S = PHT[:, :4, :] + cls.R
+    K = PHT @ np.linalg.inv(S)
+    x = x + (K @ y[:, :, None])[:, :, 0]
+    I_KH = np.broadcast_to(np.eye(7), P.shape).copy()
+    I_KH[:, :, :4] -= K
+    P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ cls.R @ K.transpose(0, 2, 1)
+
+    start = 0
+    for t, indices, _ in updates:
+      end = start + len(indices)
+      t.x[indices] = x[start:end]
+      t.P[indices] = P[start:end]
+      t.time_since_update[indices] = 0
+      t.hits[indices] += 1
+      t.hit_streak[indices] += 1
+      start = end
+
+  def get_state(self):
+    """
+    Returns the (n,4) current bounding box estimates.
+    """
+    return convert_x_to_bboxes(self.x)
+
+
 def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
   """
   Assigns detections to tracked object (both represented as bounding boxes)
@@ -160,7 +359,10 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
   if(len(trackers)==0):
     return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
 
-  iou_matrix = iou_batch(detections, trackers)
+  if len(detections) * len(trackers) >= GRID_MIN_PAIRS:
+    iou_matrix = iou_grid(detections, trackers)
+  else:
+    iou_matrix = iou_batch(detections, trackers)
 
   if min(iou_matrix.shape) > 0:
     a = (iou_matrix > iou_threshold).astype(np.int32)
@@ -169,34 +371,89 @@ def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
     else:
       matched_indices = linear_assignment(-iou_matrix)
   else:
-    matched_indices = np.empty(shape=(0,2))
+    matched_indices = np.empty(shape=(0,2),dtype=int)
+  matched_indices = matched_indices.reshape(-1, 2).astype(int)
 
-  unmatched_detections = []
-  for d, det in enumerate(detections):
-    if(d not in matched_indices[:,0]):
-      unmatched_detections.append(d)
-  unmatched_trackers = []
-  for t, trk in enumerate(trackers):
-    if(t not in matched_indices[:,1]):
-      unmatched_trackers.append(t)
+  detection_matched = np.zeros(len(detections), dtype=bool)
+  detection_matched[matched_indices[:,0]] = True
+  tracker_matched = np.zeros(len(trackers), dtype=bool)
+  tracker_matched[matched_indices[:,1]] = True
 
   #filter out matched with low IOU
-  matches = []
-  for m in matched_indices:
-    if(iou_matrix[m[0], m[1]]<iou_threshold):
-      unmatched_detections.append(m[0])
-      unmatched_trackers.append(m[1])
-    else:
-      matches.append(m.reshape(1,2))
-  if(len(matches)==0):
-    matches = np.empty((0,2),dtype=int)
-  else:
-    matches = np.concatenate(matches,axis=0)
+  low_iou = iou_matrix[matched_indices[:,0], matched_indices[:,1]] < iou_threshold
+  unmatched_detections = np.concatenate([np.flatnonzero(~detection_matched), matched_indices[low_iou,0]])
+  unmatched_trackers = np.concatenate([np.flatnonzero(~tracker_matched), matched_indices[low_iou,1]])
+  matches = matched_indices[~low_iou]
 
-  return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+  return matches, unmatched_detections, unmatched_trackers
 
 
 class Sort(object):
+  """
+  SORT with all Kalman filters batched in one BatchedKalmanBoxTracker.
+  With own_ids, track IDs are counted per instance instead of globally.
+  """
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, own_ids=False):
+    """
+    Sets key parameters for SORT
+    """
+    self.max_age = max_age
+    self.min_hits = min_hits
+    self.iou_threshold = iou_threshold
+    self.trackers = BatchedKalmanBoxTracker(own_ids)
+    self.frame_count = 0
+
+  def update(self, dets=np.empty((0, 5))):
+    """
+    Params:
+      dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+    Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
+    Returns the a similar array, where the last column is the object ID.
+
+    NOTE: The number of objects returned may differ from the number of detections provided.
+    """
+    trks = self.trackers.predict()
+    matched, unmatched_dets = self.associate(dets, trks)
+
+    # update matched trackers with assigned detections
+    self.trackers.update(matched[:, 1], dets[matched[:, 0], :])
+    return self.output(dets, unmatched_dets)
+
+  def associate(self, dets, trks):
+    """
+    Counts the frame, drops the trackers without a valid prediction `trks` and matches
+      the detections to the others. Returns the matches and the unmatched detections.
+    """
+    self.frame_count += 1
+    valid = ~np.any(np.isnan(trks), axis=1)
+    self.trackers.keep(valid)
+    matched, unmatched_dets, _ = associate_detections_to_trackers(dets, trks[valid], self.iou_threshold)
+    return matched, unmatched_dets
+
+  def output(self, dets, unmatched_dets):
+    """
+    Starts new trackers for the unmatched detections, returns the confirmed tracks of the
+      frame and removes the dead ones.
+    """
+    trackers = self.trackers
+    # create and initialise new trackers for unmatched detections
+    trackers.add(dets[unmatched_dets.astype(int), :])
+
+    # reversed to return the tracks in the same order as FilterpySort
+    alive = (trackers.time_since_update < 1) & ((trackers.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+    ret = np.concatenate((trackers.get_state(), trackers.ids[:, None] + 1), axis=1)[alive][::-1] # +1 as MOT benchmark requires positive
+    # remove dead tracklet
+    trackers.keep(trackers.time_since_update <= self.max_age)
+    if(len(ret)>0):
+      return ret
+    return np.empty((0,5))
+
+
+class FilterpySort(object):
+  """
+  The original SORT, with one filterpy KalmanFilter per object. Kept as the reference
+    implementation of Sort.
+  """
   def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
     """
     Sets key parameters for SORT
@@ -272,6 +529,13 @@ if __name__ == '__main__':
   # all train
   args = parse_args()
   display = args.display
+  if(display):
+    # display-only dependencies, kept out of the import path of the tracker
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    from skimage import io
   phase = args.phase
   total_time = 0.0
   total_frames = 0
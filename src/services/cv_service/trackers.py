@@ -0,0 +1,97 @@
+import threading
+import time
+
+import numpy as np
+
+from src.services.cv_service.sort.sort import BatchedKalmanBoxTracker, Sort
+
+
+class TrackerManager:
+    """
+    Independent SORT trackers for many camera streams in one process.
+
+    Every stream gets its own Sort with its own track ID counter, so IDs of different
+    cameras never interleave. `update` advances all streams of a tick together: the
+    Kalman predict and update steps of every stream run as one batch, only the
+    association is done per stream. Streams without a frame for `idle_seconds` are evicted.
+    """
+
+    def __init__(self, max_age: int = 1, min_hits: int = 3, iou_threshold: float = 0.3,
+                 idle_seconds: float = 60.):
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.idle_seconds = idle_seconds
+        self._streams: dict[object, Sort] = {}
+        self._last_update: dict[object, float] = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, stream):
+        return stream in self._streams
+
+    def get(self, stream) -> Sort:
+        with self._lock:
+            return self._get(stream)
+
+    def _get(self, stream) -> Sort:
+        tracker = self._streams.get(stream)
+        if tracker is None:
+            tracker = Sort(self.max_age, self.min_hits, self.iou_threshold, own_ids=True)
+            self._streams[stream] = tracker
+        return tracker
+
+    def remove(self, stream):
+        with self._lock:
+            self._streams.pop(stream, None)
+            self._last_update.pop(stream, None)
+
+    def evict_idle(self, now: float | None = None) -> list:
+        """
+        Drop the streams that have not been updated for `idle_seconds` and return their keys.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [stream for stream, last in self._last_update.items() if now - last > self.idle_seconds]
+            for stream in idle:
+                del self._streams[stream]
+                del self._last_update[stream]
+            self.evicted += len(idle)
+        return idle
+
+    def update(self, dets_by_stream: dict) -> dict:
+        """
+        Track one frame of every stream in `dets_by_stream` ({stream: (n,5) detections}).
+        Returns {stream: tracks} with the Sort.update output of each stream.
+        """
+        now = time.monotonic()
+        with self._lock:
+            streams = list(dets_by_stream)
+            trackers = [self._get(stream) for stream in streams]
+            dets = [np.asarray(dets_by_stream[stream], dtype=float).reshape(-1, 5) for stream in streams]
+
+            predictions = BatchedKalmanBoxTracker.predict_many([tracker.trackers for tracker in trackers]) \
+                if trackers else []
+            associations = [tracker.associate(stream_dets, trks)
+                            for tracker, stream_dets, trks in zip(trackers, dets, predictions)]
+            BatchedKalmanBoxTracker.update_many([(tracker.trackers, matched[:, 1], stream_dets[matched[:, 0], :])
+                                                 for tracker, stream_dets, (matched, _)
+                                                 in zip(trackers, dets, associations)])
+
+            tracks = {}
+            for stream, tracker, stream_dets, (_, unmatched_dets) in zip(streams, trackers, dets, associations):
+                tracks[stream] = tracker.output(stream_dets, unmatched_dets)
+                self._last_update[stream] = now
+        self.evict_idle(now)
+        return tracks
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'streams': len(self._streams),
+                'evicted': self.evicted,
+                'tracks': {str(stream): len(tracker.trackers) for stream, tracker in self._streams.items()},
+            }
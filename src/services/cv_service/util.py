@@ -1,9 +1,12 @@
 import re
 import string
-import easyocr
+import time
 import cv2 
 import numpy as np
 
+from src.conf.config import settings
+from src.services.cv_service.ocr_pool import reader_pool
+
 
 # Mapping dictionaries for character conversion
 dict_char_to_int = {'O': '0',
@@ -37,19 +40,50 @@ dict_int_to_char = {'1': 'I',
                     'L': 'I',
                     '!':'I'}
 
-def get_car(license_plate, vehicle_track_ids):
-    x1, y1, x2, y2, score, class_id = license_plate
+# Characters that can appear on a Ukrainian plate, in Latin and Cyrillic spelling
+PLATE_ALLOWLIST = '0123456789ABCEHIKMOPTX' + 'АВСЕНІКМОРТХ'
+
+# Width / height below which a plate is treated as a square two-row plate
+SQUARE_PLATE_RATIO = 1.95
+
+# Height every text line is resized to before batched recognition (easyocr's model height)
+OCR_LINE_HEIGHT = 64
+
+# Share of the plate box that has to lie inside a vehicle box for the plate to belong to it
+PLATE_MIN_CONTAINMENT = 0.9
+
+def assign_plates_to_cars(license_plates, vehicle_track_ids, min_containment=PLATE_MIN_CONTAINMENT):
+    """
+    Match every plate to the vehicle box it lies in, for all plates and vehicles at once.
+    Returns the vehicle index of each plate, -1 for plates outside every vehicle.
+
+    A plate can lie in several overlapping vehicle boxes (queues, lot overviews): it
+    goes to the one with the highest IoU, i.e. the tightest box around it.
+    """
+    plates = np.asarray(license_plates, dtype=float).reshape(-1, 6)[:, :4]
+    cars = np.asarray(vehicle_track_ids, dtype=float).reshape(-1, 5)[:, :4]
+    if not len(plates) or not len(cars):
+        return np.full(len(plates), -1, dtype=int)
 
-    foundIt = False
-    for j in range(len(vehicle_track_ids)):
-        xcar1, ycar1, xcar2, ycar2, car_id = vehicle_track_ids[j]
+    # plates x vehicles intersection areas
+    top_left = np.maximum(plates[:, None, :2], cars[None, :, :2])
+    bottom_right = np.minimum(plates[:, None, 2:], cars[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
 
-        if x1 > xcar1 and y1 > ycar1 and x2 < xcar2 and y2 < ycar2:
-            car_indx = j
-            foundIt = True
-            break
+    plate_area = ((plates[:, 2] - plates[:, 0]) * (plates[:, 3] - plates[:, 1]))[:, None]
+    car_area = ((cars[:, 2] - cars[:, 0]) * (cars[:, 3] - cars[:, 1]))[None, :]
+    containment = intersection / np.maximum(plate_area, 1e-9)
+    iou = intersection / np.maximum(plate_area + car_area - intersection, 1e-9)
 
-    if foundIt:
+    iou[containment < min_containment] = -1
+    best = iou.argmax(axis=1)
+    best[iou[np.arange(len(plates)), best] < 0] = -1
+    return best
+
+
+def get_car(license_plate, vehicle_track_ids):
+    car_indx = assign_plates_to_cars([license_plate], vehicle_track_ids)[0]
+    if car_indx != -1:
         return vehicle_track_ids[car_indx]
 
     return -1, -1, -1, -1, -1
@@ -111,11 +145,123 @@ def simple_format(text):
     return text
 
 
-def read_license_plate(license_plate_crop):
-
-    reader = easyocr.Reader(['en', 'uk'], gpu=False)
-
-    detections = reader.readtext(license_plate_crop)
+def plate_line_boxes(width, height, flag_margin=0.0):
+    """
+    Fixed text-line regions of a plate crop in easyocr's [x_min, x_max, y_min, y_max] format.
+
+    Rectangular plates are read as one line, square plates are split into two rows.
+    `flag_margin` is the fraction of the width taken by the blue "UA" strip on the left.
+    """
+    x_min = int(width * flag_margin)
+    if width / height < SQUARE_PLATE_RATIO:
+        middle = height // 2
+        return [[x_min, width, 0, middle], [x_min, width, middle, height]]
+    return [[x_min, width, 0, height]]
+
+
+def ocr_plate(reader, license_plate_crop):
+    """
+    Run OCR on a grayscale plate crop and return easyocr-style (bbox, text, score) detections.
+
+    In `recognize` mode the crop, already localized by the plate detector, goes straight to
+    the recognizer over fixed line regions, skipping easyocr's CRAFT text detection.
+    """
+    if settings.ocr_mode == 'recognize':
+        height, width = license_plate_crop.shape[:2]
+        line_boxes = plate_line_boxes(width, height, settings.ocr_flag_margin)
+        return reader.recognize(license_plate_crop, horizontal_list=line_boxes, free_list=[],
+                                allowlist=PLATE_ALLOWLIST, batch_size=len(line_boxes))
+    return reader.readtext(license_plate_crop)
+
+
+def read_license_plate(license_plate_crop, reader=None):
+
+    if reader is None:
+        with reader_pool.borrow(timeout=settings.ocr_borrow_timeout) as reader:
+            return read_license_plate(license_plate_crop, reader)
+
+    detections = ocr_plate(reader, license_plate_crop)
+    return parse_plate_detections(detections, license_plate_crop)
+
+
+def read_license_plates_batch(license_plate_crops, reader=None):
+    """
+    OCR several grayscale plate crops, from one or several frames, in one recognizer call.
+
+    Every text line of every crop is resized to a common height and stacked into a single
+    canvas that easyocr's recognizer reads as one batch. Returns the (text, score) reads in
+    the order of `license_plate_crops` together with the timing of the batch.
+    """
+    if reader is None:
+        with reader_pool.borrow(timeout=settings.ocr_borrow_timeout) as reader:
+            return read_license_plates_batch(license_plate_crops, reader)
+
+    start = time.perf_counter()
+    if settings.ocr_mode != 'recognize':
+        # Text detection has to run per crop, so there is nothing to batch
+        reads = [read_license_plate(crop, reader) for crop in license_plate_crops]
+        return reads, {'crops': len(license_plate_crops), 'lines': len(license_plate_crops),
+                       'seconds': time.perf_counter() - start}
+
+    lines = []
+    owners = []
+    for index, crop in enumerate(license_plate_crops):
+        height, width = crop.shape[:2]
+        for x_min, x_max, y_min, y_max in plate_line_boxes(width, height, settings.ocr_flag_margin):
+            line = crop[y_min:y_max, x_min:x_max]
+            if line.size == 0:
+                continue
+            scale = OCR_LINE_HEIGHT / line.shape[0]
+            line = cv2.resize(line, (max(int(line.shape[1] * scale), 1), OCR_LINE_HEIGHT))
+            lines.append(line)
+            owners.append((index, x_min, y_min, scale))
+
+    detections = [[] for _ in license_plate_crops]
+    if lines:
+        canvas = np.zeros((OCR_LINE_HEIGHT * len(lines), max(line.shape[1] for line in lines)), dtype=np.uint8)
+        line_boxes = []
+        for n, line in enumerate(lines):
+            top = n * OCR_LINE_HEIGHT
+            canvas[top:top + OCR_LINE_HEIGHT, :line.shape[1]] = line
+            line_boxes.append([0, line.shape[1], top, top + OCR_LINE_HEIGHT])
+
+        recognized = reader.recognize(canvas, horizontal_list=line_boxes, free_list=[],
+                                      allowlist=PLATE_ALLOWLIST, batch_size=len(line_boxes))
+
+        # Map every recognized line back to its crop and to the crop's coordinates
+        for bbox, text, score in recognized:
+            n = min(int(round(bbox[0][1] / OCR_LINE_HEIGHT)), len(lines) - 1)
+            index, x_min, y_min, scale = owners[n]
+            top = n * OCR_LINE_HEIGHT
+            crop_bbox = [[x_min + x / scale, y_min + (y - top) / scale] for x, y in bbox]
+            detections[index].append((crop_bbox, text, score))
+
+    reads = [parse_plate_detections(crop_detections, crop)
+             for crop_detections, crop in zip(detections, license_plate_crops)]
+    return reads, {'crops': len(license_plate_crops), 'lines': len(lines),
+                   'seconds': time.perf_counter() - start}
+
+
+def parse_plate_line(text, score, aspect_ratio):
+    """
+    Read of a plate recognized as a single line, as recognize mode reads rectangular plates.
+    What is left of the "UA" flag strip is cut off, then the line gets the same position
+    fixes as the lines of readtext.
+    """
+    text = text.upper().replace(' ', '')
+    if len(text) > 8:
+        # The flag strip is on the left, the plate number is the last 8 characters
+        text = text[-8:]
+    if len(text) < 8:
+        return (simple_format(text), score) if text else (None, None)
+    plate_shape = "square" if aspect_ratio < SQUARE_PLATE_RATIO else "rectangular"
+    return format_license(sequence_format(format_license(text), plate_shape)), score
+
+
+def parse_plate_detections(detections, license_plate_crop):
+    """
+    Turn the OCR detections of one plate crop into a (text, score) read.
+    """
     print(detections)
 
     filtered_texts = []
@@ -124,6 +270,10 @@ def read_license_plate(license_plate_crop):
 
     image_with_boxes = license_plate_crop.copy()
 
+    if settings.ocr_mode == 'recognize' and len(detections) == 1:
+        bbox, text, score = detections[0]
+        return parse_plate_line(text, score, image_width / image_height)
+
     for detection in detections:
         bbox, text, score = detection
         text = text.upper().replace(' ', '')
@@ -158,7 +308,7 @@ def read_license_plate(license_plate_crop):
     aspect_ratio = image_width / image_height
     
     # Classify based on aspect ratio
-    if aspect_ratio < 1.95:
+    if aspect_ratio < SQUARE_PLATE_RATIO:
         plate_shape = "square"
     else:
         plate_shape = "rectangular"
@@ -193,28 +343,15 @@ def write_csv(results, output_path):
                                                 'license_plate_bbox', 'license_plate_bbox_score', 'license_number',
                                                 'license_number_score'))
 
-        for frame_nmr in results.keys():
-            for car_id in results[frame_nmr].keys():
-                #print(results[frame_nmr][car_id])
-                if 'car' in results[frame_nmr][car_id].keys() and \
-                    'license_plate' in results[frame_nmr][car_id].keys() and \
-                    'text' in results[frame_nmr][car_id]['license_plate'].keys():
-                    f.write('{},{},{},{},{},{},{}\n'.format(frame_nmr,
-                                                            car_id,
-                                                            '[{} {} {} {}]'.format(
-                                                                results[frame_nmr][car_id]['car']['bbox'][0],
-                                                                results[frame_nmr][car_id]['car']['bbox'][1],
-                                                                results[frame_nmr][car_id]['car']['bbox'][2],
-                                                                results[frame_nmr][car_id]['car']['bbox'][3]),
-                                                            '[{} {} {} {}]'.format(
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][0],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][1],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][2],
-                                                                results[frame_nmr][car_id]['license_plate']['bbox'][3]),
-                                                            results[frame_nmr][car_id]['license_plate']['bbox_score'],
-                                                            results[frame_nmr][car_id]['license_plate']['text'],
-                                                            results[frame_nmr][car_id]['license_plate']['text_score'])
-                            )
+        for read in results:
+            f.write('{},{},{},{},{},{},{}\n'.format(read.frame_nmr,
+                                                    read.car_id,
+                                                    '[{} {} {} {}]'.format(*read.car_bbox),
+                                                    '[{} {} {} {}]'.format(*read.plate_bbox),
+                                                    read.bbox_score,
+                                                    read.text,
+                                                    read.text_score)
+                    )
         f.close()
 
 
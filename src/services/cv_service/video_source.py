@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+
+import cv2
+
+
+_END = object()
+
+
+class FramePrefetcher:
+    """
+    Decodes video frames ahead of the consumer on a background thread.
+
+    Decoded frames wait in a bounded queue, so decoding overlaps with inference while
+    memory stays capped at `queue_size` frames. Only every `stride`-th frame is decoded:
+    the others are skipped with `grab()`, which demuxes without converting the image.
+    Iterating yields `(frame_nmr, frame)` pairs, optionally limited to the frame range
+    [start_frame, end_frame).
+
+    A `live` prefetcher behaves like a camera: the decoder never waits for the consumer,
+    the oldest queued frame is dropped instead, and a video file is played at its own FPS.
+    `lag` is how long the last yielded frame waited in the queue.
+    """
+
+    def __init__(self, source, stride: int = 1, queue_size: int = 8, start_frame: int = 0,
+                 end_frame: int | None = None, live: bool = False):
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise ValueError(f"Could not open video source {source}.")
+        if start_frame:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.stride = max(1, stride)
+        self.live = live
+        self.frames_read = 0
+        self.frames_yielded = 0
+        self.frames_dropped = 0
+        self.lag = 0.0
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def fps(self) -> float:
+        return self.capture.get(cv2.CAP_PROP_FPS)
+
+    @property
+    def frame_count(self) -> int:
+        return int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def _put(self, item) -> bool:
+        if self.live and isinstance(item, tuple):
+            return self._put_latest(item)
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _put_latest(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.frames_dropped += 1
+                except queue.Empty:
+                    pass
+        return False
+
+    def _run(self):
+        try:
+            frame_nmr = self.start_frame
+            # Only files know their frame count, live streams are paced by the camera
+            pace = 1. / self.fps if self.live and self.frame_count > 0 and self.fps > 0 else 0.
+            started = time.monotonic()
+            while not self._stop.is_set() and (self.end_frame is None or frame_nmr < self.end_frame):
+                if pace:
+                    delay = started + (frame_nmr - self.start_frame) * pace - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                if not self.capture.grab():
+                    break
+                if frame_nmr % self.stride == 0:
+                    ret, frame = self.capture.retrieve()
+                    if not ret:
+                        break
+                    if not self._put((frame_nmr, frame, time.monotonic())):
+                        break
+                frame_nmr += 1
+                self.frames_read = frame_nmr - self.start_frame
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(_END)
+
+    def __iter__(self):
+        if self._thread is not None:
+            raise RuntimeError("FramePrefetcher can only be iterated once.")
+        self._thread = threading.Thread(target=self._run, name='frame-prefetch', daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    # Closed from another thread
+                    if self._stop.is_set():
+                        return
+                    continue
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                frame_nmr, frame, decoded_at = item
+                self.lag = time.monotonic() - decoded_at
+                self.frames_yielded += 1
+                yield frame_nmr, frame
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            # Unblock a producer waiting on a full queue
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._thread.join()
+        self.capture.release()
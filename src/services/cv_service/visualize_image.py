@@ -2,9 +2,10 @@ import ast
 import csv
 import cv2
 import numpy as np
-import pandas as pd
 from PIL import ImageFont, ImageDraw, Image
 
+from src.services.cv_service.results import PlateRead
+
 def draw_text_with_pil(image, text, license_number_score, position, font_path='arial.ttf', color=(0, 255, 0)):
     """
     Draw UTF-8 text on the image using PIL to handle non-ASCII characters.
@@ -38,42 +39,64 @@ def draw_text_with_pil(image, text, license_number_score, position, font_path='a
 
 
 
+def draw_plate_reads(image, reads, output_path, scale=1.0):
+    """
+    Draw vehicle and license plate bounding boxes with the recognized numbers.
+
+    Args:
+        image (np.ndarray): Decoded original image, it is not modified.
+        reads (Iterable[PlateRead]): Recognized plates, e.g. a RecognitionResult.
+        output_path (str): Path to save the image with drawn bounding boxes.
+        scale (float): Scale of `image` relative to the image the boxes refer to.
+    """
+    image = image.copy()
+
+    for read in reads:
+        car_bbox = [int(val * scale) for val in read.car_bbox]
+        lp_bbox = [int(val * scale) for val in read.plate_bbox]
+
+        # Draw car bounding box
+        cv2.rectangle(image, (car_bbox[0], car_bbox[1]), (car_bbox[2], car_bbox[3]), (255, 0, 0), 3)
+        cv2.putText(image, f'Car ID: {str(read.car_id)[:1]}', (car_bbox[0], car_bbox[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 0, 0), 2)
+
+        # Draw license plate bounding box
+        cv2.rectangle(image, (lp_bbox[0], lp_bbox[1]), (lp_bbox[2], lp_bbox[3]), (0, 255, 0), 3)
+        image = draw_text_with_pil(image, read.text, read.text_score, (lp_bbox[0], lp_bbox[1] - 50))
+
+    # Save the image with drawn bounding boxes
+    cv2.imwrite(output_path, image)
+    print(f"Output saved to {output_path}")
+
+
 def draw_bboxes_from_csv(image_path, csv_path, output_path):
     """
     Draw bounding boxes and scores on the image from the CSV file.
 
     Args:
-        image_path (str): Path to the original image.
+        image_path (str | np.ndarray): Path to the original image, or the decoded image itself.
         csv_path (str): Path to the CSV file containing bounding box data.
         output_path (str): Path to save the image with drawn bounding boxes.
     """
     # Read the image
-    image = cv2.imread(image_path)
+    if isinstance(image_path, np.ndarray):
+        image = image_path
+    else:
+        image = cv2.imread(image_path)
 
     # Open the CSV file and read bounding box data
+    reads = []
     with open(csv_path, 'r', encoding='utf-16') as file:
         reader = csv.DictReader(file)
         
         for row in reader:
-            # Parse car bounding box
-            car_bbox_str = row['car_bbox'].strip('[]').split()
-            car_bbox = [int(float(val)) for val in car_bbox_str]
-            car_id = row['car_id']
-            
-            # Parse license plate bounding box
-            lp_bbox_str = row['license_plate_bbox'].strip('[]').split()
-            lp_bbox = [int(float(val)) for val in lp_bbox_str]
-            license_number = row['license_number']
-            license_number_score = float(row['license_number_score'])
-            
-            # Draw car bounding box
-            cv2.rectangle(image, (car_bbox[0], car_bbox[1]), (car_bbox[2], car_bbox[3]), (255, 0, 0), 3)
-            cv2.putText(image, f'Car ID: {car_id[:1]}', (car_bbox[0], car_bbox[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 0, 0), 2)
-            
-            # Draw license plate bounding box
-            cv2.rectangle(image, (lp_bbox[0], lp_bbox[1]), (lp_bbox[2], lp_bbox[3]), (0, 255, 0), 3)
-            image = draw_text_with_pil(image, license_number, license_number_score, (lp_bbox[0], lp_bbox[1] - 50))
-    
-    # Save the image with drawn bounding boxes
-    cv2.imwrite(output_path, image)
-    print(f"Output saved to {output_path}")
\ No newline at end of file
+            reads.append(PlateRead(
+                frame_nmr=int(row['frame_nmr']),
+                car_id=row['car_id'],
+                car_bbox=[float(val) for val in row['car_bbox'].strip('[]').split()],
+                plate_bbox=[float(val) for val in row['license_plate_bbox'].strip('[]').split()],
+                bbox_score=float(row['license_plate_bbox_score']),
+                text=row['license_number'],
+                text_score=float(row['license_number_score']),
+            ))
+
+    draw_plate_reads(image, reads, output_path)